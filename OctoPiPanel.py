@@ -3,19 +3,34 @@
 __author__ = "Jonas Lorander"
 __license__ = "Simplified BSD 2-Clause License"
 
-import json
 import os
 import sys
+import time
 import pygame
 import pygbutton
-import requests
+import metrics
+import backlight
+import textcache
+import printers
+import statepoller
+import commandqueue
+import widgets
+import probes
+import argparse
 import platform
 import datetime
-import subprocess
+import math
 from pygame.locals import *
-from collections import deque
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 from ConfigParser import RawConfigParser
 
+# For the startup times, see _startup_time()
+START_TIME = time.time()
+
 class OctoPiPanel():
     """
     @var done: anything can set to True to forcequit
@@ -33,6 +48,32 @@ class OctoPiPanel():
     updatetime = cfg.getint('settings', 'updatetime')
     backlightofftime = cfg.getint('settings', 'backlightofftime')
 
+    if cfg.has_option('settings', 'backlightdimtime'):
+        backlightdimtime = cfg.getint('settings', 'backlightdimtime')
+    else:
+        backlightdimtime = 0
+
+    if cfg.has_option('settings', 'backlightdimduty'):
+        backlightdimduty = cfg.getint('settings', 'backlightdimduty')
+    else:
+        backlightdimduty = 20
+
+    if cfg.has_option('settings', 'backlightfadetime'):
+        backlightfadetime = cfg.getint('settings', 'backlightfadetime')
+    else:
+        backlightfadetime = 1000
+
+    if cfg.has_option('settings', 'max_fps'):
+        max_fps = cfg.getint('settings', 'max_fps')
+    else:
+        max_fps = 25
+
+    # Turn off a heater the thermal watch flags
+    if cfg.has_option('settings', 'thermal_cooldown'):
+        thermal_cooldown = cfg.getboolean('settings', 'thermal_cooldown')
+    else:
+        thermal_cooldown = False
+
     if cfg.has_option('settings', 'window_width'):
         win_width = cfg.getint('settings', 'window_width')
     else:
@@ -43,28 +84,44 @@ class OctoPiPanel():
     else:
         win_height = 240
 
-    addkey = '?apikey={0}'.format(apikey)
-    apiurl_printhead = '{0}/api/printer/printhead'.format(api_baseurl)
-    apiurl_tool = '{0}/api/printer/tool'.format(api_baseurl)
-    apiurl_bed = '{0}/api/printer/bed'.format(api_baseurl)
-    apiurl_job = '{0}/api/job'.format(api_baseurl)
-    apiurl_status = '{0}/api/printer?apikey={1}'.format(api_baseurl, apikey)
-    apiurl_connection = '{0}/api/connection'.format(api_baseurl)
-
-    #print apiurl_job + addkey
+    apipath_printhead = '/api/printer/printhead'
+    apipath_tool = '/api/printer/tool'
+    apipath_bed = '/api/printer/bed'
+    apipath_job = '/api/job'
 
     graph_area_left   = 30 #6
     graph_area_top    = 125
-    graph_area_width  = win_width - graph_area_left - 5
-    graph_area_height = win_height - graph_area_top - 5
 
-    def __init__(self, caption="OctoPiPanel"):
+    # Timer event waking the main loop when nothing else happens
+    WAKEUP = pygame.USEREVENT + 1
+
+    # Transparent color of the graph traces surface
+    GRAPH_COLORKEY = (255, 0, 255)
+
+    # Time windows of the graph, history tier to show or None for the whole print
+    GRAPH_WINDOWS = (0, 1, None)
+
+    def __init__(self, caption="OctoPiPanel", headless=False, width=None, height=None):
         """
-        .
+        headless - render offscreen with the SDL dummy video driver, without
+            touching the display, touchscreen or backlight hardware
+        width, height - window size, overrides the configuration file
         """
         self.done = False
         self.color_bg = pygame.Color(41, 61, 70)
 
+        # Only drive the Pi hardware (backlight, reboot, shutdown) for real
+        self.headless = headless
+        self.on_pi = platform.system() == 'Linux' and not headless
+
+        if width is not None:
+            self.win_width = width
+        if height is not None:
+            self.win_height = height
+
+        self.graph_area_width  = self.win_width - self.graph_area_left - 5
+        self.graph_area_height = self.win_height - self.graph_area_top - 5
+
         # Button settings
         self.leftPadding = 5
         self.buttonSpace = 10 if (self.win_width > 320) else 5
@@ -85,23 +142,52 @@ class OctoPiPanel():
         self.PrintTimeLeft = 0
         self.Height = 0.0
         self.FileName = "Nothing"
-        self.getstate_ticks = pygame.time.get_ticks()
-
-        # Lists for temperature data
-        self.HotEndTempList = deque([0] * self.graph_area_width)
-        self.BedTempList = deque([0] * self.graph_area_width)
 
-        #print self.HotEndTempList
-        #print self.BedTempList
-
-        if platform.system() == 'Linux':
-            if subprocess.Popen(["pidof", "X"], stdout=subprocess.PIPE).communicate()[0].strip() == "" :
+        # Timings and counters of the loop phases, OctoPrint calls and polls
+        self.metrics = metrics.Metrics()
+        self.show_metrics = False
+
+        # Every printer has one pooled keep-alive session to OctoPrint, a
+        # background thread polling its status and the temperature data of
+        # every sensor it reports, full resolution for the latest graph width
+        # of samples and downsampled tiers for the longer time windows.
+        # get_state() only picks up the snapshots of the pollers.
+        self.printers = printers.read_printers(self.cfg, self.updatetime, self.graph_area_width, self.metrics)
+        self._select_printer(0)
+
+        # Start polling right away, status is on its way while the display is set up
+        for printer in self.printers:
+            printer.start()
+
+        # With several printers the panel starts on an overview of all of them
+        self.overview = len(self.printers) > 1
+
+        # Outcome of the last command, shown at the bottom of the screen
+        self.toast = None
+        self.toast_ticks = 0
+
+        # Optional metrics export, for Prometheus over HTTP and/or as a JSON file
+        self.metrics_server = None
+        if self.cfg.has_option('settings', 'metrics_port'):
+            self.metrics_server = metrics.MetricsServer(self.metrics, self.cfg.getint('settings', 'metrics_port'))
+
+        self.metrics_writer = None
+        if self.cfg.has_option('settings', 'metrics_file'):
+            interval = self.cfg.getint('settings', 'metrics_interval') if self.cfg.has_option('settings', 'metrics_interval') else 60000
+            self.metrics_writer = metrics.MetricsWriter(self.metrics, self.cfg.get('settings', 'metrics_file'), interval)
+
+        if headless:
+            # Render to memory only
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        elif platform.system() == 'Linux':
+            # Probing the display takes subprocesses, the answers of the last start are used
+            display = probes.display_probes(self.cfg.get('settings', 'probe_cache') if self.cfg.has_option('settings', 'probe_cache') else probes.DEFAULT_CACHE)
+            if not display['x_running']:
                 # Init framebuffer/touchscreen environment variables
                 os.putenv('SDL_VIDEODRIVER', 'fbcon')
                 os.putenv('SDL_FBDEV'      , '/dev/fb1')
                 # If this is not a RoboPeak USB display
-                lsusb = subprocess.Popen('lsusb', stdout=subprocess.PIPE).communicate()[0]
-                if lsusb.find('fccf:a001') == -1 :
+                if not display['robopeak']:
                     os.putenv('SDL_MOUSEDRV', 'TSLIB')
                     os.putenv('SDL_MOUSEDEV', '/dev/input/touchscreen')
 
@@ -117,90 +203,185 @@ class OctoPiPanel():
         #self.screen = pygame.display.set_mode(modes[0], FULLSCREEN, 16)
         pygame.display.set_caption( caption )
 
-        # Set font
+        # Set font, the splash screen only needs the first one. Cyberbit.ttf
+        # is not shipped, without it pygame's default font is used.
         #self.fntText = pygame.font.Font("Cyberbit.ttf", 12)
-        self.fntText = pygame.font.Font(os.path.join(self.scriptDirectory, "Cyberbit.ttf"), 12)
+        fontPath = os.path.join(self.scriptDirectory, "Cyberbit.ttf")
+        if not os.path.exists(fontPath):
+            fontPath = None
+        self.fntText = pygame.font.Font(fontPath, 12)
         self.fntText.set_bold(True)
-        self.fntTextSmall = pygame.font.Font(os.path.join(self.scriptDirectory, "Cyberbit.ttf"), 10)
+
+        # Time to first frame, splash screen and first real one, and to first status
+        self.startup_splash = None
+        self.startup_frame = None
+        self.startup_status = None
+        self._draw_splash()
+
+        self.fntTextSmall = pygame.font.Font(fontPath, 10)
         self.fntTextSmall.set_bold(True)
 
         # backlight on off status and control
         self.bglight_ticks = pygame.time.get_ticks()
         self.bglight_on = True
+        self.bglight_dimmed = False
+        self.bglight_fading_off = False
+
+        # Main loop scheduling. Between frames the loop blocks on input until
+        # the next status check, graph sample or backlight timeout is due.
+        self.clock = pygame.time.Clock()
+        self.state_ticks = 0
+        self.state_interval = min(self.updatetime, 250)
+
+        # Buttons of the printer view with what they do, when they are shown
+        # and what they say. Most of them are hidden while printing.
+        self.buttons = widgets.WidgetRegistry()
+        idle = lambda: not (self.Printing or self.Paused)
+        busy = lambda: self.Printing or self.Paused
 
         # Home X/Y/Z buttons
-        self.btnHomeXY        = pygbutton.PygButton((  self.leftPadding,   5, self.buttonWidth, self.buttonHeight), "Home X/Y")
-        self.btnHomeZ         = pygbutton.PygButton((  self.leftPadding,  35, self.buttonWidth, self.buttonHeight), "Home Z")
-        self.btnZUp           = pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,  35, self.buttonWidth, self.buttonHeight), "Z +25")
+        self.btnHomeXY        = self.buttons.add(pygbutton.PygButton((  self.leftPadding,   5, self.buttonWidth, self.buttonHeight), "Home X/Y"), self._home_xy, idle)
+        self.btnHomeZ         = self.buttons.add(pygbutton.PygButton((  self.leftPadding,  35, self.buttonWidth, self.buttonHeight), "Home Z"), self._home_z, idle)
+        self.btnZUp           = self.buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,  35, self.buttonWidth, self.buttonHeight), "Z +25"), self._z_up, idle)
 
         # Heat buttons
-        self.btnHeatBed       = pygbutton.PygButton((  self.leftPadding,  65, self.buttonWidth, self.buttonHeight), "Heat bed")
-        self.btnHeatHotEnd    = pygbutton.PygButton((  self.leftPadding,  95, self.buttonWidth, self.buttonHeight), "Heat hot end")
+        self.btnHeatBed       = self.buttons.add(pygbutton.PygButton((  self.leftPadding,  65, self.buttonWidth, self.buttonHeight), "Heat bed"), self._heat_bed, idle,
+                                                 lambda: "Turn off bed" if self.HotBed else "Heat bed")
+        self.btnHeatHotEnd    = self.buttons.add(pygbutton.PygButton((  self.leftPadding,  95, self.buttonWidth, self.buttonHeight), "Heat hot end"), self._heat_hotend, idle,
+                                                 lambda: "Turn off hot end" if self.HotHotEnd else "Heat hot end")
 
         # Start, stop and pause buttons
-        self.btnStartPrint    = pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,   5, self.buttonWidth, self.buttonHeight), "Start print")
-        self.btnAbortPrint    = pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,   5, self.buttonWidth, self.buttonHeight), "Abort print", (200, 0, 0))
-        self.btnPausePrint    = pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,  35, self.buttonWidth, self.buttonHeight), "Pause print")
-
-        # Shutdown and reboot buttons
-        self.btnReboot        = pygbutton.PygButton((  self.leftPadding + self.buttonWidth * 2 + self.buttonSpace * 2,   5, self.buttonWidth, self.buttonHeight), "Reboot");
-        self.btnShutdown      = pygbutton.PygButton((  self.leftPadding + self.buttonWidth * 2 + self.buttonSpace * 2,  35, self.buttonWidth, self.buttonHeight), "Shutdown");
-
-        # I couldnt seem to get at pin 252 for the backlight using the usual method,
-        # but this seems to work
-        if platform.system() == 'Linux':
-            os.system("echo 252 > /sys/class/gpio/export")
-            os.system("echo 'out' > /sys/class/gpio/gpio252/direction")
-            os.system("echo '1' > /sys/class/gpio/gpio252/value")
-            os.system("echo 508 > /sys/class/gpio/export")
-            os.system("echo 'out' > /sys/class/gpio/gpio508/direction")
-            os.system("echo '1' > /sys/class/gpio/gpio508/value")
-            os.system("echo pwm > /sys/class/rpi-pwm/pwm0/mode")
-            os.system("echo '1000' > /sys/class/rpi-pwm/pwm0/frequency")
-            os.system("echo '90' > /sys/class/rpi-pwm/pwm0/duty")
-            os.system("echo '1' > /sys/class/backlight/soc\:backlight/brightness")
+        self.btnStartPrint    = self.buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,   5, self.buttonWidth, self.buttonHeight), "Start print"), self._start_print,
+                                                 lambda: idle() and self.JobLoaded)
+        self.btnAbortPrint    = self.buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,   5, self.buttonWidth, self.buttonHeight), "Abort print", (200, 0, 0)), self._abort_print, busy)
+        self.btnPausePrint    = self.buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace,  35, self.buttonWidth, self.buttonHeight), "Pause print"), self._pause_print, busy,
+                                                 lambda: "Resume" if self.Paused else "Pause")
+
+        # Shutdown and reboot buttons, the printers button takes the place of reboot when there are several printers
+        self.btnReboot        = self.buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth * 2 + self.buttonSpace * 2,   5, self.buttonWidth, self.buttonHeight), "Reboot"), self._reboot,
+                                                 lambda: idle() and len(self.printers) == 1)
+        self.btnShutdown      = self.buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth * 2 + self.buttonSpace * 2,  35, self.buttonWidth, self.buttonHeight), "Shutdown"), self._shutdown, idle)
+        self.btnPrinters      = self.buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth * 2 + self.buttonSpace * 2,   5, self.buttonWidth, self.buttonHeight), "Printers"), self._show_overview,
+                                                 lambda: len(self.printers) > 1)
+
+        # Overview of all printers, one tile each above the reboot and shutdown buttons
+        self.overview_buttons = widgets.WidgetRegistry()
+        self.overview_buttons.add(pygbutton.PygButton((  self.leftPadding, self.win_height - self.buttonHeight - 5, self.buttonWidth, self.buttonHeight), "Reboot"), self._reboot)
+        self.overview_buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth * 2 + self.buttonSpace * 2, self.win_height - self.buttonHeight - 5, self.buttonWidth, self.buttonHeight), "Shutdown"), self._shutdown)
+        self.tile_rects = self._layout_tiles(len(self.printers), self.win_height - self.buttonHeight - 10)
+
+        # File browser of the shown printer, opened by tapping the job status.
+        # Only the rows in view are drawn, the list scrolls by dragging it or
+        # tapping the scroll bar above or below its thumb.
+        self.browser = False
+        self.browser_top = 0
+        self.browser_selected = None
+        self.browser_drag = None
+        self.browser_row_height = 16
+        browserBottom = self.win_height - self.buttonHeight - 5
+        self.browser_buttons = widgets.WidgetRegistry()
+        self.browser_buttons.add(pygbutton.PygButton((  self.leftPadding, browserBottom, self.buttonWidth, self.buttonHeight), "Back"), self._hide_browser)
+        self.btnBrowserPrint  = self.browser_buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth + self.buttonSpace, browserBottom, self.buttonWidth, self.buttonHeight), "Print"), self._print_selected,
+                                                         lambda: self.browser_selected is not None and not (self.Printing or self.Paused))
+        self.btnBrowserQueue  = self.browser_buttons.add(pygbutton.PygButton((  self.leftPadding + self.buttonWidth * 2 + self.buttonSpace * 2, browserBottom, self.buttonWidth, self.buttonHeight), "Queue"), self._queue_selected,
+                                                         lambda: self.browser_selected is not None,
+                                                         lambda: "Unqueue" if self.browser_selected in self.printer.queue else "Queue")
+        self.browser_list_rect = pygame.Rect(0, 18, self.win_width - 14, browserBottom - 23)
+        self.browser_bar_rect = pygame.Rect(self.win_width - 12, 18, 10, browserBottom - 23)
+
+        # Dirty region rendering. Buttons sharing a rect (e.g. start and
+        # abort) are repainted together, every region keeps the key it was
+        # last drawn with and is only repainted and flushed when it changes.
+        self.label_left = self.leftPadding + self.buttonWidth + self.buttonSpace
+        self.job_rect = pygame.Rect(self.label_left, 90, self.win_width - self.label_left, 30)
+        self.graph_rect = pygame.Rect(0, self.graph_area_top - 6, self.win_width, self.win_height - self.graph_area_top + 6)
+        self.region_keys = {}
+        self.full_redraw = True
+
+        # Temperature at the top of the graph and its cached static background
+        self.graph_scale = 250
+
+        # Time window of the graph, tap the graph to switch
+        self.graph_window = 0
+        self.graph_background = None
+        self.graph_background_key = None
+
+        # Temperature traces, scrolled one column per new sample
+        self.graph_traces = None
+        self.graph_traces_rect = None
+        self.graph_traces_key = None
+        self.graph_traces_version = 0
+
+        # Frames drawn and pixels flushed to the display, for measuring the cost of draw()
+        self.frames = 0
+        self.pixels_pushed = 0
+        self.pixels_per_second = 0
+        self.pixels_ticks = pygame.time.get_ticks()
+
+        self.metrics.gauges['fps'] = self.clock.get_fps
+        self.metrics.gauges['pixels_per_second'] = lambda: self.pixels_per_second
+        self.metrics.gauges['frames'] = lambda: self.frames
+        self.metrics.gauges['textcache_hits'] = lambda: textcache.cache.hits
+        self.metrics.gauges['textcache_misses'] = lambda: textcache.cache.misses
+        self.metrics.gauges['startup_splash_seconds'] = lambda: self.startup_splash or 0.0
+        self.metrics.gauges['startup_frame_seconds'] = lambda: self.startup_frame or 0.0
+        self.metrics.gauges['startup_status_seconds'] = lambda: self.startup_status or 0.0
+        self.metrics_lines = ()
+        self.metrics_ticks = 0
+
+        # Backlight is controlled through sysfs on the Pi
+        self.backlight = backlight.Backlight()
+        self.fader = backlight.Fader(self.backlight)
+        if self.on_pi:
+            self.backlight.setup_async()
         # Init of class done
         print "OctoPiPanel initiated"
 
-    def Start(self):
+    def Start(self, frames=0, dump=None):
+        """
+        frames - stop after this many frames, 0 runs until quit
+        dump - save every frame to this path, formatted with the frame number
+            (e.g. frame%04d.png), see dump_frame()
+        """
         # OctoPiPanel started
         print "OctoPiPanel started!"
         print "---"
 
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        if self.metrics_writer is not None:
+            self.metrics_writer.start()
+
         """ game loop: input, move, render"""
         while not self.done:
-            # Handle events
-            self.handle_events()
+            drawn = self.run_frame()
 
-            # Update info from printer every other seconds
-            if pygame.time.get_ticks() - self.getstate_ticks > self.updatetime:
-                self.get_state()
-                self.getstate_ticks = pygame.time.get_ticks()
-
-            # Is it time to turn of the backlight?
-            if self.backlightofftime > 0 and platform.system() == 'Linux':
-                if pygame.time.get_ticks() - self.bglight_ticks > self.backlightofftime:
-                    # disable the backlight
-                    os.system("echo '0' > /sys/class/gpio/gpio252/value")
-                    os.system("echo '0' > /sys/class/gpio/gpio508/value")
-                    os.system("echo '1' > /sys/class/rpi-pwm/pwm0/duty")
-                    os.system("echo '0' > /sys/class/backlight/soc\:backlight/brightness")
-                    self.bglight_ticks = pygame.time.get_ticks()
-                    self.bglight_on = False
-
-            # Update buttons visibility, text, graphs etc
-            self.update()
+            if drawn and dump is not None:
+                self.dump_frame(dump % self.frames)
 
-            # Draw everything
-            self.draw()
+            if frames > 0 and self.frames >= frames:
+                self.done = True
+
+            # Sleep until there is input or something is due. Nothing can
+            # wake a headless panel, it runs at max_fps instead.
+            if not self.headless:
+                self._wait()
+
+        pygame.time.set_timer(self.WAKEUP, 0)
 
         """ Clean up """
+        for printer in self.printers:
+            printer.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.metrics_writer is not None:
+            self.metrics_writer.stop()
+            self.metrics_writer.write()
+
         # enable the backlight before quiting
-        if platform.system() == 'Linux':
-            os.system("echo '1' > /sys/class/gpio/gpio252/value")
-            os.system("echo '1' > /sys/class/gpio/gpio508/value")
-            os.system("echo '90' > /sys/class/rpi-pwm/pwm0/duty")
-            os.system("echo '1' > /sys/class/backlight/soc\:backlight/brightness")
+        if self.on_pi:
+            self.backlight.on()
+        self.backlight.close()
 
         # OctoPiPanel is going down.
         print "OctoPiPanel is going down."
@@ -208,6 +389,106 @@ class OctoPiPanel():
         """ Quit """
         pygame.quit()
 
+    def run_frame(self):
+        """Run one iteration of the game loop, return True if a frame was drawn."""
+        # Handle events
+        with self.metrics.phase('handle_events'):
+            self.handle_events()
+
+        # Pick up the latest info from printer, never blocks
+        with self.metrics.phase('get_state'):
+            self.get_state()
+        self.state_ticks = pygame.time.get_ticks()
+
+        # Is it time to dim or turn of the backlight?
+        self._update_backlight()
+
+        # Nothing to see while the backlight is off
+        if not self.bglight_on:
+            return False
+
+        # Update buttons visibility, text, graphs etc
+        with self.metrics.phase('update'):
+            self.update()
+
+        # Draw everything, at most max_fps times a second
+        with self.metrics.phase('draw'):
+            self.draw()
+        self.clock.tick(self.max_fps)
+
+        return True
+
+    def dump_frame(self, path):
+        """Save the screen to path, as an image for .png, .bmp, .tga and .jpg
+        files and as raw RGB bytes (width * height * 3) for anything else."""
+        if os.path.splitext(path)[1].lower() in ('.png', '.bmp', '.tga', '.jpg'):
+            pygame.image.save(self.screen, path)
+        else:
+            with open(path, 'wb') as f:
+                f.write(pygame.image.tostring(self.screen, 'RGB'))
+
+    def _update_backlight(self):
+        """Dim and turn off the backlight after backlightdimtime and backlightofftime."""
+        if not self.bglight_on or not self.on_pi:
+            return
+
+        ticks = pygame.time.get_ticks()
+        idle = ticks - self.bglight_ticks
+
+        if self.backlightofftime > 0 and idle > self.backlightofftime and not self.bglight_fading_off:
+            self.fader.fade_to(backlight.DUTY_OFF, self.backlightfadetime, ticks)
+            self.bglight_fading_off = True
+        elif self.backlightdimtime > 0 and idle > self.backlightdimtime and not self.bglight_dimmed:
+            self.fader.fade_to(self.backlightdimduty, self.backlightfadetime, ticks)
+            self.bglight_dimmed = True
+
+        self.fader.update(ticks)
+
+        if self.bglight_fading_off and not self.fader.active:
+            # disable the backlight
+            self.backlight.off()
+            for printer in self.printers:
+                printer.poller.set_asleep(True)
+            self.bglight_ticks = ticks
+            self.bglight_on = False
+            self.bglight_dimmed = False
+            self.bglight_fading_off = False
+
+    def _next_due(self):
+        """Return ticks until the next timer (status, graph sample, backlight) is due."""
+        ticks = pygame.time.get_ticks()
+
+        if self.bglight_on:
+            due = [self.state_ticks + self.state_interval]
+            if self.toast is not None:
+                due.append(self.toast_ticks)
+            if self.on_pi:
+                if self.fader.active:
+                    due.append(ticks + self.fader.step)
+                if self.backlightdimtime > 0 and not self.bglight_dimmed:
+                    due.append(self.bglight_ticks + self.backlightdimtime + 1)
+                if self.backlightofftime > 0 and not self.bglight_fading_off:
+                    due.append(self.bglight_ticks + self.backlightofftime + 1)
+        else:
+            # Idle, only keep the temperature history going
+            due = [min(printer.history_ticks for printer in self.printers) + self.updatetime]
+
+        return max(0, min(due) - ticks)
+
+    def _wait(self):
+        """Block on input events until the next timer is due."""
+        timeout = self._next_due()
+        if timeout <= 0 or pygame.event.peek():
+            return
+
+        # pygame.event.wait() has no timeout, let a timer event wake us up
+        pygame.time.set_timer(self.WAKEUP, timeout)
+        event = pygame.event.wait()
+        pygame.time.set_timer(self.WAKEUP, 0)
+
+        if event.type != self.WAKEUP:
+            pygame.event.post(event)
+
     def handle_events(self):
         """handle all events."""
         for event in pygame.event.get():
@@ -223,279 +504,632 @@ class OctoPiPanel():
                 # Look for specific keys.
                 #  Could be used if a keyboard is connected
                 if event.key == pygame.K_a:
-                    print "Got A key"
+                    # Toggle the metrics overlay
+                    self.show_metrics = not self.show_metrics
+                    self.full_redraw = True
 
             # It should only be possible to click a button if you can see it
             #  e.g. the backlight is on
             if self.bglight_on == True:
-                if 'click' in self.btnHomeXY.handleEvent(event):
-                    self._home_xy()
-
-                if 'click' in self.btnHomeZ.handleEvent(event):
-                    self._home_z()
-
-                if 'click' in self.btnZUp.handleEvent(event):
-                    self._z_up()
-
-                if 'click' in self.btnHeatBed.handleEvent(event):
-                    self._heat_bed()
-
-                if 'click' in self.btnHeatHotEnd.handleEvent(event):
-                    self._heat_hotend()
-
-                if 'click' in self.btnStartPrint.handleEvent(event):
-                    self._start_print()
-
-                if 'click' in self.btnAbortPrint.handleEvent(event):
-                    self._abort_print()
+                if self.overview:
+                    self.overview_buttons.handle_event(event)
+                elif self.browser:
+                    self.browser_buttons.handle_event(event)
+                    self._browser_event(event)
+                else:
+                    self.buttons.handle_event(event)
 
-                if 'click' in self.btnPausePrint.handleEvent(event):
-                    self._pause_print()
+            # Did the user click on the screen?
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                # Tapping a printer on the overview opens its own view
+                if self.bglight_on and self.overview:
+                    index = pygame.Rect(event.pos, (1, 1)).collidelist(self.tile_rects)
+                    if index != -1:
+                        self._select_printer(index)
 
-                if 'click' in self.btnReboot.handleEvent(event):
-                    self._reboot()
+                # Tapping the time left or completion opens the file browser
+                elif self.bglight_on and not self.browser and self.job_rect.collidepoint(event.pos):
+                    self._show_browser()
 
-                if 'click' in self.btnShutdown.handleEvent(event):
-                    self._shutdown()
+                # Tapping the graph switches its time window
+                elif self.bglight_on and not self.browser and self.graph_rect.collidepoint(event.pos):
+                    self.graph_window = (self.graph_window + 1) % len(self.GRAPH_WINDOWS)
 
-            # Did the user click on the screen?
-            if event.type == pygame.MOUSEBUTTONDOWN:
                 # Reset backlight counter
                 self.bglight_ticks = pygame.time.get_ticks()
 
-                if self.bglight_on == False and platform.system() == 'Linux':
-                    # enable the backlight
-                    os.system("echo '1' > /sys/class/gpio/gpio252/value")
-                    os.system("echo '1' > /sys/class/gpio/gpio508/value")
-                    os.system("echo '90' > /sys/class/rpi-pwm/pwm0/duty")
-                    os.system("echo '1' > /sys/class/backlight/soc\:backlight/brightness")
+                if (self.bglight_on == False or self.bglight_dimmed or self.bglight_fading_off) and self.on_pi:
+                    # enable the backlight, at full brightness right away
+                    self.fader.stop()
+                    self.backlight.on()
+                    for printer in self.printers:
+                        printer.poller.set_asleep(False)
                     self.bglight_on = True
+                    self.bglight_dimmed = False
+                    self.bglight_fading_off = False
                     print "Background light on."
 
     """
-    Get status update from API, regarding temp etc.
+    Get status update from the background poller, regarding temp etc.
     """
     def get_state(self):
-        try:
-            req = requests.get(self.apiurl_status)
-
-            if req.status_code == 200:
-                state = json.loads(req.text)
+        # Keep the temperature history of every printer going
+        ticks = pygame.time.get_ticks()
+        for printer in self.printers:
+            printer.update(ticks, self.updatetime)
+
+            # Tell how the commands sent in the background went
+            for command in printer.commands.results():
+                self._command_finished(printer, command)
+
+            # Warn of heaters misbehaving
+            if printer.watch is not None:
+                for anomaly in printer.watch.results():
+                    self._thermal_anomaly(printer, anomaly)
+
+        # Optimistic fields are dropped once a poll after their command
+        # confirmed or corrected them, or at once if the command failed
+        command = self.optimistic_command
+        if command is not None and command.finished is not None and (command.error is not None or self.poller.updated > command.finished):
+            self.optimistic = {}
+            self.optimistic_command = None
+            self.state_seq = -1
+
+        if self.startup_status is None and self.poller.updated:
+            self.startup_status = self.poller.updated - START_TIME
+            print "Startup: first status after {0:.0f} ms".format(self.startup_status * 1000)
+
+        # Only copy the status of the shown printer when some of it changed
+        state = self.poller.state
+        if state.seq != self.state_seq:
+            self.state_seq = state.seq
+            for field in statepoller.STATE_FIELDS:
+                setattr(self, field, getattr(state, field))
+            for field, value in self.optimistic.items():
+                setattr(self, field, value)
+
+        # Hide the toast when its time is up, uncovering what is below
+        if self.toast is not None and ticks >= self.toast_ticks:
+            self.toast = None
+            self.full_redraw = True
 
-                # Set status flags
-                tempKey = 'temps' if 'temps' in state else 'temperature'
+        return
 
-                if 'tool0' in state[tempKey]:
-                    self.HotEndTemp = state[tempKey]['tool0']['actual']
-                    self.HotEndTempTarget = state[tempKey]['tool0']['target']
+    def _command_finished(self, printer, command):
+        """Show the outcome of a command as a toast."""
+        label = command.label
+        if command.count > 1:
+            label = u"{0} (x{1})".format(label, command.count)
+        if len(self.printers) > 1:
+            label = u"{0}: {1}".format(printer.name, label)
 
-                if 'bed' in state[tempKey]:
-                    self.BedTemp = state[tempKey]['bed']['actual']
-                    self.BedTempTarget = state[tempKey]['bed']['target']
-                else:
-                    self.BedTemp = -1;
-                    self.BedTempTarget = -1;
+        if command.error is None:
+            self._show_toast(label, (0, 160, 0))
+        else:
+            self._show_toast(u"{0} failed: {1}".format(label, command.error), (200, 0, 0))
+
+    def _thermal_anomaly(self, printer, anomaly):
+        """Warn of a heater flagged by the thermal watch, turn it off if thermal_cooldown is set."""
+        text = u"{0} {1}: {2:.0f}\N{DEGREE SIGN}C, target {3:.0f}\N{DEGREE SIGN}C".format(anomaly.key, anomaly.kind, anomaly.actual, anomaly.target)
+        if len(self.printers) > 1:
+            text = u"{0}: {1}".format(printer.name, text)
+        print u"Thermal warning ({0}): {1} {2} at {3:.1f} C, target {4:.1f} C".format(printer.name, anomaly.key, anomaly.kind, anomaly.actual, anomaly.target).encode('utf-8')
+
+        # The toast of the command tells how turning it off went
+        if self.thermal_cooldown and anomaly.target > 0 and (anomaly.key == 'bed' or anomaly.key.startswith('tool')):
+            label = "Turn off {0} ({1})".format(anomaly.key, anomaly.kind)
+            if anomaly.key == 'bed':
+                self._set_bed_target(0, label, printer)
+            else:
+                self._set_tool_target(anomaly.key, 0, label, printer)
+            return
+
+        self._show_toast(text, (200, 0, 0), 10000)
+
+    def _show_toast(self, text, color, duration=3000):
+        self.toast = (text, color)
+        self.toast_ticks = pygame.time.get_ticks() + duration
+
+    def _select_printer(self, index):
+        """Show the view of printers[index], its buttons command that printer."""
+        self.printer = self.printers[index]
+        self.client = self.printer.client
+        self.poller = self.printer.poller
+        self.temps = self.printer.temps
+        self.state_seq = -1
+        self.optimistic = {}
+        self.optimistic_command = None
+        self.overview = False
+        self.graph_traces_key = None
+        self.full_redraw = True
+
+    def _show_overview(self):
+        self.overview = True
+        self.full_redraw = True
+
+    def _show_browser(self):
+        self.browser = True
+        self.browser_top = 0
+        self.browser_selected = None
+        self.printer.files.watch(True)
+        self.full_redraw = True
+
+    def _hide_browser(self):
+        self.browser = False
+        self.browser_drag = None
+        self.printer.files.watch(False)
+        self.full_redraw = True
+
+    def _browser_rows(self):
+        """Return the number of rows the file list shows."""
+        return self.browser_list_rect.height / self.browser_row_height
+
+    def _browser_scroll(self, top):
+        """Scroll the file list to show row top first, as far as there are rows."""
+        self.browser_top = max(0, min(top, len(self.printer.files.files) - self._browser_rows()))
+
+    def _browser_thumb(self):
+        """Return the rect of the scroll bar thumb."""
+        bar = self.browser_bar_rect
+        count = max(1, len(self.printer.files.files))
+        height = max(10, bar.height * min(count, self._browser_rows()) / count)
+        top = bar.top + (bar.height - height) * self.browser_top / max(1, count - self._browser_rows())
+        return pygame.Rect(bar.left, min(top, bar.bottom - height), bar.width, height)
+
+    def _browser_event(self, event):
+        """Scroll the file list by dragging it or tapping the scroll bar, select a file by tapping it."""
+        if event.type == MOUSEBUTTONDOWN:
+            if self.browser_list_rect.collidepoint(event.pos):
+                self.browser_drag = (event.pos[1], self.browser_top, False)
+            elif self.browser_bar_rect.collidepoint(event.pos):
+                # A page up above the thumb, down below it
+                page = max(1, self._browser_rows() - 1)
+                self._browser_scroll(self.browser_top + (-page if event.pos[1] < self._browser_thumb().top else page))
+
+        elif event.type == MOUSEMOTION and self.browser_drag is not None:
+            # Drags of a few pixels are still taps
+            start, top, dragged = self.browser_drag
+            moved = event.pos[1] - start
+            if dragged or abs(moved) > 4:
+                self.browser_drag = (start, top, True)
+                self._browser_scroll(top - int(round(moved / float(self.browser_row_height))))
+
+        elif event.type == MOUSEBUTTONUP and self.browser_drag is not None:
+            if not self.browser_drag[2] and self.browser_list_rect.collidepoint(event.pos):
+                files = self.printer.files.files
+                index = self.browser_top + (event.pos[1] - self.browser_list_rect.top) / self.browser_row_height
+                if index < len(files):
+                    entry = files[index]
+                    self.browser_selected = None if entry == self.browser_selected else entry
+            self.browser_drag = None
+
+    def _print_selected(self):
+        self.printer.queue.select(self.browser_selected, True)
+        self._hide_browser()
+
+    def _queue_selected(self):
+        queue = self.printer.queue
+        if self.browser_selected in queue:
+            queue.remove(self.browser_selected)
+        else:
+            queue.add(self.browser_selected)
 
-                if self.HotEndTempTarget == None:
-                    self.HotEndTempTarget = 0.0
+    def _layout_tiles(self, count, height):
+        """Return a rect per printer, in a grid of about square tiles filling width x height."""
+        columns = max(1, int(round(math.sqrt(count * self.win_width / float(height)))))
+        rows = (count + columns - 1) / columns
+        width = self.win_width / columns
+        tileHeight = height / max(1, rows)
+        return [pygame.Rect((i % columns) * width, (i / columns) * tileHeight, width, tileHeight) for i in range(count)]
 
-                if self.BedTempTarget == None:
-                    self.BedTempTarget = 0.0
+    """
+    Update buttons, text, graphs etc.
+    """
+    def update(self):
+        # Set buttons visibility and texts
+        if self.browser:
+            self.browser_buttons.update()
+        else:
+            self.buttons.update()
 
-                if self.HotEndTempTarget > 0.0:
-                    self.HotHotEnd = True
-                else:
-                    self.HotHotEnd = False
+        return
 
-                if self.BedTempTarget > 0.0:
-                    self.HotBed = True
-                else:
-                    self.HotBed = False
+    def draw(self):
+        self.frames += 1
+        dirty = []
+
+        if self.full_redraw:
+            #clear whole screen
+            self.screen.fill( self.color_bg )
+            self.region_keys = {}
+
+        if self.overview:
+            self._draw_overview(dirty)
+        elif self.browser:
+            self._draw_browser(dirty)
+        else:
+            self._draw_printer(dirty)
 
-                #print self.apiurl_status
-            elif req.status_code == 401:
-                print "Error: {0}".format(req.text)
+        # Toast with the outcome of the last command
+        if self.toast is not None:
+            self._draw_toast(dirty)
 
-            # Get info about current job
-            req = requests.get(self.apiurl_job + self.addkey)
-            if req.status_code == 200:
-                jobState = json.loads(req.text)
+        # Metrics overlay on top of everything else
+        if self.show_metrics:
+            self._draw_metrics_overlay(dirty)
 
-            req = requests.get(self.apiurl_connection + self.addkey)
-            if req.status_code == 200:
-                connState = json.loads(req.text)
+        # update screen, only the parts that changed
+        if self.full_redraw:
+            self.full_redraw = False
+            dirty = [self.screen.get_rect()]
 
-                #print self.apiurl_job + self.addkey
+        if dirty:
+            pygame.display.update(dirty)
+            self.pixels_pushed += sum(r.width * r.height for r in dirty)
 
-                self.Completion = jobState['progress']['completion'] # In procent
-                self.PrintTimeLeft = jobState['progress']['printTimeLeft']
-                #self.Height = state['currentZ']
-                self.FileName = jobState['job']['file']['name']
-                self.JobLoaded = connState['current']['state'] == "Operational" and (jobState['job']['file']['name'] != "") or (jobState['job']['file']['name'] != None)
+        if self.startup_frame is None:
+            self.startup_frame = time.time() - START_TIME
+            print "Startup: splash after {0:.0f} ms, first frame after {1:.0f} ms".format(self.startup_splash * 1000, self.startup_frame * 1000)
 
-                # Save temperatures to lists
-                self.HotEndTempList.popleft()
-                self.HotEndTempList.append(self.HotEndTemp)
-                self.BedTempList.popleft()
-                self.BedTempList.append(self.BedTemp)
+        ticks = pygame.time.get_ticks()
+        if ticks - self.pixels_ticks >= 1000:
+            self.pixels_per_second = self.pixels_pushed * 1000 / (ticks - self.pixels_ticks)
+            self.pixels_pushed = 0
+            self.pixels_ticks = ticks
 
-                #print self.HotEndTempList
-                #print self.BedTempList
+    def _draw_printer(self, dirty):
+        """Draw the buttons, status and graph of the shown printer."""
+        # Draw buttons
+        self._draw_buttons(self.buttons, dirty)
 
-                self.Paused = connState['current']['state'] == "Paused"
-                self.Printing = connState['current']['state'] == "Printing"
+        # Place temperatures texts
+        self._draw_label(60, u'Hot end: {0}\N{DEGREE SIGN}C ({1}\N{DEGREE SIGN}C)'.format(self.HotEndTemp, self.HotEndTempTarget), (220, 0, 0), dirty)
+        self._draw_label(75, u'Bed: {0}\N{DEGREE SIGN}C ({1}\N{DEGREE SIGN}C)'.format(self.BedTemp, self.BedTempTarget), (66, 100, 255), dirty)
 
+        # Place time left and compeltetion texts
+        if self.JobLoaded == False or self.Completion == None:
+            self.Completion = 0
 
-        except requests.exceptions.ConnectionError as e:
-            print "Connection Error ({0}): {1}".format(e.errno, e.strerror)
+        # Smoothed estimate of the printer, with the time of day the print is done
+        now = time.time()
+        timeLeft = self.printer.eta.time_left(now)
+        if timeLeft is None:
+            timeLeft = self.PrintTimeLeft if self.JobLoaded and self.PrintTimeLeft is not None else 0
+            self._draw_label(90, "Time left: {0}".format(datetime.timedelta(seconds = int(timeLeft))), (200, 200, 200), dirty)
+        else:
+            finish = datetime.datetime.fromtimestamp(now + timeLeft)
+            self._draw_label(90, "Time left: {0} (at {1:%H:%M})".format(datetime.timedelta(seconds = int(timeLeft)), finish), (200, 200, 200), dirty)
+        self._draw_label(105, "Completion: {0:.1f}%".format(self.Completion), (200, 200, 200), dirty)
+
+        # Temperature Graphing, only when a new sample or target arrived
+        tier = self._graph_tier()
+        targets = tuple(series.target for series in self.temps)
+        alerts = self.printer.watch.active() if self.printer.watch is not None else ()
+        if self._region_changed('graph', (tier, self.temps.version(tier), self.temps.structure, targets, alerts)):
+            self._draw_graph()
+            dirty.append(self.graph_rect)
+
+    def _draw_splash(self):
+        """Show a first frame at once, while the rest starts up."""
+        self.screen.fill(self.color_bg)
+        if len(self.printers) > 1:
+            target = "{0} printers".format(len(self.printers))
+        else:
+            target = self.printer.client.baseurl
+
+        top = self.win_height / 2 - 20
+        for text, color in (("OctoPiPanel", (255, 255, 255)), ("Connecting to {0}".format(target), (200, 200, 200))):
+            lbl = self.fntText.render(text, 1, color)
+            self.screen.blit(lbl, ((self.win_width - lbl.get_width()) / 2, top))
+            top += 20
+
+        pygame.display.flip()
+        self.startup_splash = time.time() - START_TIME
+
+    def _draw_buttons(self, registry, dirty):
+        """Repaint the buttons of registry whose looks changed since last frame."""
+        for rect, buttons in registry.groups:
+            key = tuple((b.visible, b.caption, b.bgcolor, b.buttonDown, b.mouseOverButton) for b in buttons)
+            if self._region_changed(('button', rect.topleft), key):
+                self.screen.fill(self.color_bg, rect)
+                for b in buttons:
+                    b.draw(self.screen)
+                dirty.append(rect)
+
+    def _draw_overview(self, dirty):
+        """Draw a tile per printer with its state, temperatures and progress."""
+        self._draw_buttons(self.overview_buttons, dirty)
+
+        for printer, rect in zip(self.printers, self.tile_rects):
+            state = printer.poller.state
+            alerts = printer.watch.active() if printer.watch is not None else ()
+            if not printer.poller.fresh():
+                status, color = "Offline", (128, 128, 128)
+            elif alerts:
+                status, color = "Thermal " + alerts[0][1], (255, 0, 0)
+            elif state.Printing:
+                status, color = "Printing", (0, 200, 0)
+            elif state.Paused:
+                status, color = "Paused", (255, 160, 0)
+            else:
+                status, color = "Idle", (200, 200, 200)
+
+            completion = state.Completion if (state.Printing or state.Paused) and state.Completion is not None else 0
+            key = (printer.name, status,
+                   int(round(state.HotEndTemp or 0)), int(round(state.HotEndTempTarget or 0)),
+                   int(round(state.BedTemp or 0)), int(round(state.BedTempTarget or 0)), int(completion))
+            if not self._region_changed(('tile', rect.topleft), key):
+                continue
+
+            self.screen.fill(self.color_bg, rect)
+            inner = rect.inflate(-4, -4)
+            pygame.draw.rect(self.screen, color, inner, 1)
+
+            self.screen.set_clip(inner)
+            self.screen.blit(textcache.cache.render(self.fntText, printer.name, 1, (255, 255, 255)), (inner.left + 3, inner.top + 2))
+            if completion:
+                status = "{0} {1}%".format(status, key[6])
+            self.screen.blit(textcache.cache.render(self.fntTextSmall, status, 1, color), (inner.left + 3, inner.top + 17))
+            self.screen.blit(textcache.cache.render(self.fntTextSmall, u'Hot end {0}/{1}\N{DEGREE SIGN}C'.format(*key[2:4]), 1, (220, 0, 0)), (inner.left + 3, inner.top + 29))
+            self.screen.blit(textcache.cache.render(self.fntTextSmall, u'Bed {0}/{1}\N{DEGREE SIGN}C'.format(*key[4:6]), 1, (66, 100, 255)), (inner.left + 3, inner.top + 41))
+            self.screen.set_clip(None)
+
+            # Progress bar
+            bar = pygame.Rect(inner.left + 3, inner.bottom - 8, inner.width - 6, 5)
+            pygame.draw.rect(self.screen, (80, 80, 80), bar)
+            bar.width = bar.width * completion / 100
+            pygame.draw.rect(self.screen, color, bar)
+
+            dirty.append(rect)
+
+    def _draw_browser(self, dirty):
+        """Draw the file list of the shown printer, only the rows in view, and its buttons."""
+        self._draw_buttons(self.browser_buttons, dirty)
+
+        files = self.printer.files
+        queue = self.printer.queue
+        if files.error is not None:
+            header = "Files: {0}".format(files.error)
+        elif not files.version:
+            header = "Loading files..."
+        else:
+            header = "{0} files, {1} queued".format(len(files.files), len(queue))
+        rect = pygame.Rect(0, 0, self.win_width, self.browser_list_rect.top)
+        if self._region_changed('browser_header', header):
+            self.screen.fill(self.color_bg, rect)
+            self.screen.blit(textcache.cache.render(self.fntText, header, 1, (200, 200, 200)), (self.leftPadding, 2))
+            dirty.append(rect)
+
+        # The list may have shrunk since it was scrolled
+        self._browser_scroll(self.browser_top)
+        rows = files.files[self.browser_top:self.browser_top + self._browser_rows()]
+        key = (files.version, self.browser_top, self.browser_selected, tuple(queue.entries))
+        if not self._region_changed('browser_list', key):
+            return
+
+        area = self.browser_list_rect.union(self.browser_bar_rect)
+        self.screen.fill(self.color_bg, area)
+        for i, entry in enumerate(rows):
+            row = pygame.Rect(self.browser_list_rect.left, self.browser_list_rect.top + i * self.browser_row_height, self.browser_list_rect.width, self.browser_row_height)
+            if entry == self.browser_selected:
+                self.screen.fill((80, 110, 125), row)
+
+            # Estimated print time at the right, the name clipped before it
+            if entry.estimate:
+                minutes = int(entry.estimate) / 60
+                lbl = textcache.cache.render(self.fntTextSmall, "{0}:{1:02d}".format(minutes / 60, minutes % 60), 1, (160, 160, 160))
+                self.screen.blit(lbl, (row.right - lbl.get_width() - 2, row.top + 2))
+
+            name = entry.name
+            if entry in queue:
+                name = u"{0}. {1}".format(queue.entries.index(entry) + 1, name)
+            self.screen.set_clip(row.left, row.top, row.width - 40, row.height)
+            self.screen.blit(textcache.cache.render(self.fntText, name, 1, (255, 200, 0) if entry in queue else (255, 255, 255)), (row.left + self.leftPadding, row.top + 1))
+            self.screen.set_clip(None)
+
+        # Scroll bar, only when there is more than fits
+        if len(files.files) > self._browser_rows():
+            pygame.draw.rect(self.screen, (80, 80, 80), self.browser_bar_rect)
+            pygame.draw.rect(self.screen, (200, 200, 200), self._browser_thumb())
+
+        dirty.append(area)
+
+    def _draw_toast(self, dirty):
+        """Draw the toast over the bottom of the screen."""
+        text, color = self.toast
+        rect = pygame.Rect(0, self.win_height - 18, self.win_width, 18)
+        if not self._region_changed('toast', self.toast) and rect.collidelist(dirty) == -1:
+            return
+
+        self.screen.fill(color, rect)
+        lbl = textcache.cache.render(self.fntText, text, 1, (255, 255, 255))
+        self.screen.blit(lbl, (rect.left + 4, rect.top + 2))
+        dirty.append(rect)
+
+    def _draw_metrics_overlay(self, dirty):
+        """Draw the metrics over the top of the screen, refreshed twice a second."""
+        ticks = pygame.time.get_ticks()
+        if ticks - self.metrics_ticks >= 500:
+            self.metrics_ticks = ticks
+            lines = ["fps {0:.0f}  pixels/s {1}  text cache {2}/{3}".format(
+                         self.clock.get_fps(), self.pixels_per_second, textcache.cache.hits, textcache.cache.misses),
+                     "  ".join("{0} {1:.2f}".format(name, self.metrics.phases[name].recent * 1000.0)
+                               for name in ('handle_events', 'get_state', 'update', 'draw') if name in self.metrics.phases) + " ms",
+                     "polls {0}  failed {1}  late {2}".format(
+                         self.metrics.counters.get('polls', 0), self.metrics.counters.get('polls_failed', 0), self.metrics.counters.get('polls_late', 0))]
+            for name in sorted(self.metrics.http):
+                h = self.metrics.http[name]
+                lines.append("{0} {1:.0f} ms (max {2:.0f})".format(name, h.recent * 1000.0, h.max * 1000.0))
+            lines = tuple(lines)
+        else:
+            lines = self.metrics_lines
+
+        rect = pygame.Rect(0, 0, self.win_width, len(lines) * 12 + 4)
+        if lines == self.metrics_lines and rect.collidelist(dirty) == -1 and not self.full_redraw:
+            return
+        self.metrics_lines = lines
+
+        self.screen.fill((0, 0, 0), rect)
+        for i, line in enumerate(lines):
+            self.screen.blit(textcache.cache.render(self.fntTextSmall, line, 1, (255, 255, 0)), (4, 2 + i * 12))
+        dirty.append(rect)
+
+    def _region_changed(self, region, key):
+        """Remember key for region, return True if it differs from last frame."""
+        if self.region_keys.get(region) == key:
+            return False
+
+        self.region_keys[region] = key
+        return True
+
+    def _draw_label(self, top, text, color, dirty):
+        """Render a status label if its text changed since last frame."""
+        if not self._region_changed(('label', top), (text, color)):
+            return
+
+        rect = pygame.Rect(self.label_left, top, self.win_width - self.label_left, 15)
+        self.screen.fill(self.color_bg, rect)
+        lbl = textcache.cache.render(self.fntText, text, 1, color)
+        self.screen.blit(lbl, rect.topleft)
+        dirty.append(rect)
+
+    def _build_graph_background(self):
+        """Render the static parts of the graph (area, axes, scale) to a surface."""
+        bg = pygame.Surface(self.graph_rect.size).convert()
+        bg.fill(self.color_bg)
+
+        # Graph coordinates relative to the background surface
+        left = self.graph_area_left - self.graph_rect.left
+        top = self.graph_area_top - self.graph_rect.top
+        width = self.graph_area_width
+        height = self.graph_area_height
 
-        return
+        # Graph area
+        pygame.draw.rect(bg, (255, 255, 255), (left, top, width, height))
 
-    """
-    Update buttons, text, graphs etc.
-    """
-    def update(self):
-        # Set home buttons visibility
-        self.btnHomeXY.visible = not (self.Printing or self.Paused)
-        self.btnHomeZ.visible = not (self.Printing or self.Paused)
-        self.btnZUp.visible = not (self.Printing or self.Paused)
-
-        # Set abort and pause buttons visibility
-        self.btnStartPrint.visible = not (self.Printing or self.Paused) and self.JobLoaded
-        self.btnAbortPrint.visible = self.Printing or self.Paused
-        self.btnPausePrint.visible = self.Printing or self.Paused
-
-        # Set texts on pause button
-        if self.Paused:
-            self.btnPausePrint.caption = "Resume"
-        else:
-            self.btnPausePrint.caption = "Pause"
+        # Graph axes
+        # X, temp
+        pygame.draw.line(bg, (0, 0, 0), [left, top], [left, top + height], 2)
 
-        # Set abort, pause, reboot and shutdown buttons visibility
-        self.btnHeatHotEnd.visible = not (self.Printing or self.Paused)
-        self.btnHeatBed.visible = not (self.Printing or self.Paused)
-        self.btnReboot.visible = not (self.Printing or self.Paused)
-        self.btnShutdown.visible = not (self.Printing or self.Paused)
+        # X-axis divisions, scale and grey lines, 0 at the bottom
+        for i in range(6):
+            y = top + (height / 5) * (5 - i)
+            pygame.draw.line(bg, (0, 0, 0), [left - 3, y], [left, y], 2)
 
-        # Set texts on heat buttons
-        if self.HotHotEnd:
-            self.btnHeatHotEnd.caption = "Turn off hot end"
-        else:
-            self.btnHeatHotEnd.caption = "Heat hot end"
+            lbl = self.fntTextSmall.render(str(self.graph_scale * i / 5), 1, (200, 200, 200))
+            bg.blit(lbl, (left - 26, y - 6))
 
-        if self.HotBed:
-            self.btnHeatBed.caption = "Turn off bed"
-        else:
-            self.btnHeatBed.caption = "Heat bed"
+            if 0 < i < 5:
+                pygame.draw.line(bg, (200, 200, 200), [left + 2, y], [left + width - 2, y], 1)
 
-        return
+        # Y, time, 2 seconds per pixel at full resolution
+        pygame.draw.line(bg, (0, 0, 0), [left, top + height], [left + width, top + height], 2)
 
-    def draw(self):
-        #clear whole screen
-        self.screen.fill( self.color_bg )
+        # Time window
+        lbl = self.fntTextSmall.render(self._graph_window_label(), 1, (128, 128, 128))
+        bg.blit(lbl, (left + width - lbl.get_width() - 3, top + 1))
 
-        # Draw buttons
-        self.btnHomeXY.draw(self.screen)
-        self.btnHomeZ.draw(self.screen)
-        self.btnZUp.draw(self.screen)
-        self.btnHeatBed.draw(self.screen)
-        self.btnHeatHotEnd.draw(self.screen)
-        self.btnStartPrint.draw(self.screen)
-        self.btnAbortPrint.draw(self.screen)
-        self.btnPausePrint.draw(self.screen)
-        self.btnReboot.draw(self.screen)
-        self.btnShutdown.draw(self.screen)
+        # Legend, one name per sensor in its trace color
+        x = left + 4
+        for series in self.temps:
+            lbl = self.fntTextSmall.render(series.key, 1, series.color)
+            bg.blit(lbl, (x, top + 1))
+            x += lbl.get_width() + 6
 
-        # Place temperatures texts
-        lblHotEndTemp = self.fntText.render(u'Hot end: {0}\N{DEGREE SIGN}C ({1}\N{DEGREE SIGN}C)'.format(self.HotEndTemp, self.HotEndTempTarget), 1, (220, 0, 0))
-        self.screen.blit(lblHotEndTemp, (self.leftPadding + self.buttonWidth + self.buttonSpace, 60))
-        lblBedTemp = self.fntText.render(u'Bed: {0}\N{DEGREE SIGN}C ({1}\N{DEGREE SIGN}C)'.format(self.BedTemp, self.BedTempTarget), 1, (66, 100, 255))
-        self.screen.blit(lblBedTemp, (self.leftPadding + self.buttonWidth + self.buttonSpace, 75))
+        return bg
 
-        # Place time left and compeltetion texts
-        if self.JobLoaded == False or self.PrintTimeLeft == None or self.Completion == None:
-            self.Completion = 0
-            self.PrintTimeLeft = 0;
+    def _graph_tier(self):
+        """Return the history tier shown in the current graph window."""
+        tier = self.GRAPH_WINDOWS[self.graph_window]
+        if tier is None:
+            tier = self.temps.tier_for(self.temps.samples - self.printer.print_start_sample)
+        return tier
 
-        lblPrintTimeLeft = self.fntText.render("Time left: {0}".format(datetime.timedelta(seconds = self.PrintTimeLeft)), 1, (200, 200, 200))
-        self.screen.blit(lblPrintTimeLeft, (self.leftPadding + self.buttonWidth + self.buttonSpace, 90))
+    def _graph_window_label(self):
+        if self.GRAPH_WINDOWS[self.graph_window] is None:
+            return "print"
 
-        lblCompletion = self.fntText.render("Completion: {0:.1f}%".format(self.Completion), 1, (200, 200, 200))
-        self.screen.blit(lblCompletion, (self.leftPadding + self.buttonWidth + self.buttonSpace, 105))
+        span = self.temps.spans[self._graph_tier()]
+        minutes = int(round(self.graph_area_width * span * self.updatetime / 60000.0))
+        if minutes < 120:
+            return "{0} min".format(minutes)
+        return "{0} h".format(minutes / 60)
 
+    def _draw_graph(self):
         # Temperature Graphing
-        # Graph area
-        pygame.draw.rect(self.screen, (255, 255, 255), (self.graph_area_left, self.graph_area_top, self.graph_area_width, self.graph_area_height))
+        # The static background is only rebuilt when size or scale changes
+        key = (self.graph_rect.size, self.graph_area_width, self.graph_area_height, self.graph_scale, self._graph_window_label(), self.printer, self.temps.structure)
+        if self.graph_background_key != key:
+            self.graph_background = self._build_graph_background()
+            self.graph_background_key = key
 
-        # Graph axes
-        # X, temp
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left, self.graph_area_top], [self.graph_area_left, self.graph_area_top + self.graph_area_height], 2)
-
-        # X-axis divisions
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * 5], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * 5], 2) # 0
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * 4], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * 4], 2) # 50
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * 3], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * 3], 2) # 100
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * 2], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * 2], 2) # 150
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * 1], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * 1], 2) # 200
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * 0], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * 0], 2) # 250
-
-        # X-axis scale
-        lbl0 = self.fntTextSmall.render("0", 1, (200, 200, 200))
-        self.screen.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * 5))
-        lbl0 = self.fntTextSmall.render("50", 1, (200, 200, 200))
-        self.screen.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * 4))
-        lbl0 = self.fntTextSmall.render("100", 1, (200, 200, 200))
-        self.screen.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * 3))
-        lbl0 = self.fntTextSmall.render("150", 1, (200, 200, 200))
-        self.screen.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * 2))
-        lbl0 = self.fntTextSmall.render("200", 1, (200, 200, 200))
-        self.screen.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * 1))
-        lbl0 = self.fntTextSmall.render("250", 1, (200, 200, 200))
-        self.screen.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * 0))
-
-        # X-axis divisions, grey lines
-        pygame.draw.line(self.screen, (200, 200, 200), [self.graph_area_left + 2, self.graph_area_top + (self.graph_area_height / 5) * 4], [self.graph_area_left + self.graph_area_width - 2, self.graph_area_top + (self.graph_area_height / 5) * 4], 1) # 50
-        pygame.draw.line(self.screen, (200, 200, 200), [self.graph_area_left + 2, self.graph_area_top + (self.graph_area_height / 5) * 3], [self.graph_area_left + self.graph_area_width - 2, self.graph_area_top + (self.graph_area_height / 5) * 3], 1) # 100
-        pygame.draw.line(self.screen, (200, 200, 200), [self.graph_area_left + 2, self.graph_area_top + (self.graph_area_height / 5) * 2], [self.graph_area_left + self.graph_area_width - 2, self.graph_area_top + (self.graph_area_height / 5) * 2], 1) # 150
-        pygame.draw.line(self.screen, (200, 200, 200), [self.graph_area_left + 2, self.graph_area_top + (self.graph_area_height / 5) * 1], [self.graph_area_left + self.graph_area_width - 2, self.graph_area_top + (self.graph_area_height / 5) * 1], 1) # 200
-
-        # Y, time, 2 seconds per pixel
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left, self.graph_area_top + self.graph_area_height], [self.graph_area_left + self.graph_area_width, self.graph_area_top + self.graph_area_height], 2)
+        self.screen.blit(self.graph_background, self.graph_rect)
 
         # Scaling factor
-        g_scale = self.graph_area_height / 250.0
-
-        # Print temperatures for hot end
-        i = 0
-        for t in self.HotEndTempList:
-            x = self.graph_area_left + i
-            y = self.graph_area_top + self.graph_area_height - int(t * g_scale)
-            pygame.draw.line(self.screen, (220, 0, 0), [x, y], [x + 1, y], 2)
-            i += 1
-
-        # Print temperatures for bed
-        i = 0
-        for t in self.BedTempList:
-            x = self.graph_area_left + i
-            y = self.graph_area_top + self.graph_area_height - int(t * g_scale)
-            pygame.draw.line(self.screen, (0, 0, 220), [x, y], [x + 1, y], 2)
-            i += 1
-
-        # Draw target temperatures
-        # Hot end
-        pygame.draw.line(self.screen, (180, 40, 40), [self.graph_area_left, self.graph_area_top + self.graph_area_height - (self.HotEndTempTarget * g_scale)], [self.graph_area_left + self.graph_area_width, self.graph_area_top + self.graph_area_height - (self.HotEndTempTarget * g_scale)], 1);
-        # Bed
-        pygame.draw.line(self.screen, (40, 40, 180), [self.graph_area_left, self.graph_area_top + self.graph_area_height - (self.BedTempTarget * g_scale)], [self.graph_area_left + self.graph_area_width, self.graph_area_top + self.graph_area_height - (self.BedTempTarget * g_scale)], 1);
+        g_scale = self.graph_area_height / float(self.graph_scale)
 
+        # Temperature traces live on their own surface
+        self._update_graph_traces(g_scale)
+        self.screen.blit(self.graph_traces, self.graph_traces_rect)
 
-        # update screen
-        pygame.display.update()
+        # Draw target temperatures
+        for series in self.temps:
+            if series.target > 0:
+                y = self.graph_area_top + self.graph_area_height - (series.target * g_scale)
+                pygame.draw.line(self.screen, series.target_color, [self.graph_area_left, y], [self.graph_area_left + self.graph_area_width, y], 1)
+
+        # Frame the graph in red while the thermal watch flags a sensor, and say what is wrong
+        alerts = self.printer.watch.active() if self.printer.watch is not None else ()
+        if alerts:
+            pygame.draw.rect(self.screen, (255, 0, 0), (self.graph_area_left, self.graph_area_top, self.graph_area_width, self.graph_area_height), 2)
+            text = ", ".join("{0} {1}".format(key, kind) for key, kind in alerts)
+            self.screen.blit(textcache.cache.render(self.fntTextSmall, text, 1, (255, 0, 0)), (self.graph_area_left + 4, self.graph_area_top + 13))
+
+    def _trace_points(self, values, g_scale, first=0):
+        """Return the trace points of values on the traces surface, x starting at first."""
+        base = self.graph_area_top + self.graph_area_height - self.graph_traces_rect.top
+        # NumPy only pays off for whole traces, not for a few new segments
+        if numpy is not None and len(values) > 16:
+            ys = base - (numpy.asarray(values, dtype=numpy.float32) * g_scale).astype(numpy.int32)
+            xs = numpy.arange(first, first + len(ys), dtype=numpy.int32)
+            return numpy.column_stack((xs, ys)).tolist()
+
+        return [(first + i, base - int(t * g_scale)) for i, t in enumerate(values)]
+
+    def _update_graph_traces(self, g_scale):
+        """Bring the traces surface up to date with the temperature history."""
+        tier = self._graph_tier()
+        width = self.graph_area_width
+        key = (width, self.graph_area_height, self.graph_scale, tier, self.temps.structure)
+        version = self.temps.version(tier)
+        samples = version - self.graph_traces_version
+        self.graph_traces_version = version
+
+        if self.graph_traces_key != key or samples >= width or samples < 0:
+            # Draw every trace as one polyline
+            self.graph_traces_rect = pygame.Rect(self.graph_area_left, self.graph_area_top - 2, width + 1, self.graph_area_height + 4)
+            self.graph_traces = pygame.Surface(self.graph_traces_rect.size).convert()
+            self.graph_traces.set_colorkey(self.GRAPH_COLORKEY)
+            self.graph_traces.fill(self.GRAPH_COLORKEY)
+            self.graph_traces_key = key
+
+            for series in self.temps:
+                pygame.draw.lines(self.graph_traces, series.color, False, self._trace_points(series.history.series(tier), g_scale), 2)
+
+        elif samples > 0:
+            # Scroll the traces and only draw the new segments
+            first = width - samples - 1
+            self.graph_traces.scroll(-samples, 0)
+            self.graph_traces.fill(self.GRAPH_COLORKEY, (first + 1, 0, self.graph_traces_rect.width - first - 1, self.graph_traces_rect.height))
+
+            for series in self.temps:
+                pygame.draw.lines(self.graph_traces, series.color, False, self._trace_points(series.history.tail(tier, samples + 1), g_scale, first), 2)
 
     def _home_xy(self):
         data = { "command": "home", "axes": ["x", "y"] }
 
         # Send command
-        self._sendAPICommand(self.apiurl_printhead, data)
+        self._sendAPICommand(self.apipath_printhead, data, "Home X/Y")
 
         return
 
@@ -503,15 +1137,15 @@ class OctoPiPanel():
         data = { "command": "home", "axes": ["z"] }
 
         # Send command
-        self._sendAPICommand(self.apiurl_printhead, data)
+        self._sendAPICommand(self.apipath_printhead, data, "Home Z")
 
         return
 
     def _z_up(self):
         data = { "command": "jog", "x": 0, "y": 0, "z": 25 }
 
-        # Send command
-        self._sendAPICommand(self.apiurl_printhead, data)
+        # Send command, taps not sent yet add up to one move
+        self._sendAPICommand(self.apipath_printhead, data, "Z +25", commandqueue.merge_jog)
 
         return
 
@@ -519,33 +1153,49 @@ class OctoPiPanel():
     def _heat_bed(self):
         # is the bed already hot, in that case turn it off
         if self.HotBed:
-            data = { "command": "target", "target": 0 }
+            self._set_bed_target(0, self.btnHeatBed.caption)
         else:
-            data = { "command": "target", "target": 50 }
-
-        # Send command
-        self._sendAPICommand(self.apiurl_bed, data)
+            self._set_bed_target(50, self.btnHeatBed.caption)
 
         return
 
     def _heat_hotend(self):
         # is the bed already hot, in that case turn it off
         if self.HotHotEnd:
-            data = { "command": "target", "targets": { "tool0": 0   } }
+            self._set_tool_target("tool0", 0, self.btnHeatHotEnd.caption)
         else:
-            data = { "command": "target", "targets": { "tool0": 190 } }
-
-        # Send command
-        self._sendAPICommand(self.apiurl_tool, data)
+            self._set_tool_target("tool0", 190, self.btnHeatHotEnd.caption)
 
         return
 
+    # Set the bed target of printer, the shown one by default
+    def _set_bed_target(self, target, label, printer=None):
+        data = { "command": "target", "target": target }
+
+        # Send command, show the new target before OctoPrint confirms it
+        command = self._sendAPICommand(self.apipath_bed, data, label, commandqueue.merge_replace, printer)
+        if printer is None or printer is self.printer:
+            self._set_optimistic(command, HotBed=target > 0, BedTempTarget=float(target))
+
+        return command
+
+    # Set the target of a tool of printer, the shown one by default
+    def _set_tool_target(self, tool, target, label, printer=None):
+        data = { "command": "target", "targets": { tool: target } }
+
+        # Send command, targets of several tools not sent yet go out together
+        command = self._sendAPICommand(self.apipath_tool, data, label, commandqueue.merge_targets, printer)
+        if tool == "tool0" and (printer is None or printer is self.printer):
+            self._set_optimistic(command, HotHotEnd=target > 0, HotEndTempTarget=float(target))
+
+        return command
+
     def _start_print(self):
         # here we should display a yes/no box somehow
         data = { "command": "start" }
 
         # Send command
-        self._sendAPICommand(self.apiurl_job, data)
+        self._sendAPICommand(self.apipath_job, data, "Start print")
 
         return
 
@@ -554,7 +1204,7 @@ class OctoPiPanel():
         data = { "command": "cancel" }
 
         # Send command
-        self._sendAPICommand(self.apiurl_job, data)
+        self._sendAPICommand(self.apipath_job, data, "Abort print")
 
         return
 
@@ -563,13 +1213,13 @@ class OctoPiPanel():
         data = { "command": "pause" }
 
         # Send command
-        self._sendAPICommand(self.apiurl_job, data)
+        self._sendAPICommand(self.apipath_job, data, self.btnPausePrint.caption)
 
         return
 
     # Reboot system
     def _reboot(self):
-        if platform.system() == 'Linux':
+        if self.on_pi:
             os.system("reboot")
         else:
             pygame.image.save(self.screen, "screenshot.jpg")
@@ -581,7 +1231,7 @@ class OctoPiPanel():
 
     # Shutdown system
     def _shutdown(self):
-        if platform.system() == 'Linux':
+        if self.on_pi:
             os.system("shutdown -h 0")
 
         self.done = True
@@ -589,11 +1239,25 @@ class OctoPiPanel():
 
         return
 
-    # Send API-data to OctoPrint
-    def _sendAPICommand(self, url, data):
-        headers = { 'content-type': 'application/json', 'X-Api-Key': self.apikey }
-        r = requests.post(url, data=json.dumps(data), headers=headers)
+    # Send API-data to OctoPrint, in the background
+    def _sendAPICommand(self, path, data, label, merge=None, printer=None):
+        return (printer or self.printer).commands.submit(path, data, label, merge)
+
+    # Show fields as a command will change them, until OctoPrint tells
+    def _set_optimistic(self, command, **fields):
+        self.optimistic.update(fields)
+        self.optimistic_command = command
+        for field, value in fields.items():
+            setattr(self, field, value)
 
 if __name__ == '__main__':
-    opp = OctoPiPanel("OctoPiPanel!")
-    opp.Start()
+    parser = argparse.ArgumentParser(description="OctoPiPanel, a touch screen panel for OctoPrint")
+    parser.add_argument('--headless', action='store_true', help="render offscreen, without display or backlight")
+    parser.add_argument('--frames', type=int, default=0, help="quit after this many frames")
+    parser.add_argument('--dump', help="save every frame, e.g. frame%%04d.png or frame%%04d.raw")
+    parser.add_argument('--width', type=int, help="window width, overrides window_width")
+    parser.add_argument('--height', type=int, help="window height, overrides window_height")
+    args = parser.parse_args()
+
+    opp = OctoPiPanel("OctoPiPanel!", headless=args.headless, width=args.width, height=args.height)
+    opp.Start(frames=args.frames, dump=args.dump)
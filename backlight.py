@@ -0,0 +1,162 @@
+"""
+Backlight for OctoPiPanel
+
+Controls the background light of the display through sysfs. Every sysfs file
+is opened once and kept open, values are written straight to it and writes
+of the value a file already holds are skipped. Files which do not exist on
+the current hardware are silently ignored.
+
+Fader dims the light gradually by stepping the PWM duty cycle. It never
+sleeps, the main loop calls update() whenever the next step is due.
+
+The sysfs root can be pointed at any directory, e.g. a temporary one, to run
+without the hardware.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import os
+import threading
+
+# Duty cycle of the rpi-pwm backlight when on and off
+DUTY_ON = 90
+DUTY_OFF = 1
+
+
+class Backlight(object):
+
+    def __init__(self, root='/sys/class'):
+        self.root = root
+        self.duty = DUTY_ON
+        self._files = {}  # path -> open file, or None if it could not be opened
+        self._values = {} # path -> last value written
+        self._lock = threading.RLock()
+
+    def setup(self):
+        """Export and configure the GPIO pins and PWM, then turn the light on."""
+        with self._lock:
+            # I couldnt seem to get at pin 252 for the backlight using the usual method,
+            # but this seems to work
+            for pin in (252, 508):
+                if not os.path.isdir(self._path('gpio/gpio{0}'.format(pin))):
+                    self._write_once('gpio/export', pin)
+                self._write('gpio/gpio{0}/direction'.format(pin), 'out')
+
+            self._write('rpi-pwm/pwm0/mode', 'pwm')
+            self._write('rpi-pwm/pwm0/frequency', 1000)
+            self.on()
+
+    def setup_async(self):
+        """Run setup() in a background thread, writes made meanwhile wait for it."""
+        thread = threading.Thread(target=self.setup, name="Backlight")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def on(self):
+        self._write('gpio/gpio252/value', 1)
+        self._write('gpio/gpio508/value', 1)
+        self.set_duty(DUTY_ON)
+        self._write('backlight/soc:backlight/brightness', 1)
+
+    def off(self):
+        self._write('gpio/gpio252/value', 0)
+        self._write('gpio/gpio508/value', 0)
+        self.set_duty(DUTY_OFF)
+        self._write('backlight/soc:backlight/brightness', 0)
+
+    def set_duty(self, duty):
+        self.duty = duty
+        self._write('rpi-pwm/pwm0/duty', duty)
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                if f is not None:
+                    f.close()
+            self._files = {}
+            self._values = {}
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _write(self, name, value):
+        with self._lock:
+            self._write_locked(name, str(value))
+
+    def _write_locked(self, name, value):
+        if self._values.get(name) == value:
+            return
+
+        if name not in self._files:
+            try:
+                self._files[name] = open(self._path(name), 'w', 0)
+            except IOError:
+                self._files[name] = None
+
+        f = self._files[name]
+        if f is None:
+            return
+
+        try:
+            f.seek(0)
+            f.write(value)
+            self._values[name] = value
+        except IOError as e:
+            print "Backlight error ({0}): {1}".format(name, e)
+            return
+
+        # Keeps plain files, e.g. in a test directory, holding just the value
+        try:
+            f.truncate()
+        except IOError:
+            pass
+
+    def _write_once(self, name, value):
+        try:
+            with open(self._path(name), 'w') as f:
+                f.write(str(value))
+        except IOError as e:
+            print "Backlight error ({0}): {1}".format(name, e)
+
+
+class Fader(object):
+    """
+    @var active: True while a fade is in progress
+    """
+
+    def __init__(self, backlight, step=40):
+        """step is the time between duty cycle updates in ms."""
+        self.backlight = backlight
+        self.step = step
+        self.active = False
+        self._from = self._to = DUTY_ON
+        self._start = 0
+        self._duration = 0
+
+    def fade_to(self, duty, duration, ticks):
+        """Start fading from the current duty cycle to duty over duration ms."""
+        self._from = self.backlight.duty
+        self._to = duty
+        self._start = ticks
+        self._duration = max(1, duration)
+        self.active = True
+        self.update(ticks)
+
+    def stop(self):
+        self.active = False
+
+    def update(self, ticks):
+        """Step the fade, return ms until the next step is due or None when done."""
+        if not self.active:
+            return None
+
+        progress = min(1.0, float(ticks - self._start) / self._duration)
+        self.backlight.set_duty(int(round(self._from + (self._to - self._from) * progress)))
+
+        if progress >= 1.0:
+            self.active = False
+            return None
+
+        return self.step
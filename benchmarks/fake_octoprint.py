@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+A local stand-in for OctoPrint, serving scripted /api/printer, /api/job and
+/api/connection responses for benchmarks and manual testing. It also pushes
+the same status as "current" messages over /sockjs/websocket, every
+PUSH_INTERVAL seconds, for trying push mode (push = true) without a printer.
+
+Temperatures ramp up towards their targets and the job progresses with every
+request. A scenario can make responses slow or make them fail:
+
+    normal  - answers at once
+    slow    - every response is delayed
+    failing - every third request gets a 500, every fifth connection is dropped
+
+    python benchmarks/fake_octoprint.py [--port 5000] [--scenario normal]
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+# Seconds between push messages
+PUSH_INTERVAL = 0.5
+
+# Appended to the Sec-WebSocket-Key of a websocket handshake, RFC 6455
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+SCENARIOS = {
+    'normal':  { 'delay': 0.0, 'fail_every': 0, 'drop_every': 0 },
+    'slow':    { 'delay': 0.5, 'fail_every': 0, 'drop_every': 0 },
+    'failing': { 'delay': 0.0, 'fail_every': 3, 'drop_every': 5 },
+}
+
+
+class PrinterScript(object):
+    """The scripted printer, every request moves it one step ahead."""
+
+    def __init__(self):
+        self.step = 0
+        self.lock = threading.Lock()
+
+    def advance(self):
+        with self.lock:
+            self.step += 1
+            return self.step
+
+    def printer(self, step):
+        temps = {}
+        for key, start, target in (('tool0', 20.0, 210.0), ('tool1', 20.0, 0.0), ('bed', 20.0, 60.0), ('chamber', 25.0, None)):
+            actual = start + min(step, 100) / 100.0 * ((target or start) - start)
+            temps[key] = { 'actual': round(actual, 1), 'target': target, 'offset': 0 }
+        return { 'temperature': temps, 'state': { 'text': 'Printing' } }
+
+    def job(self, step):
+        completion = min(100.0, step * 0.05)
+        return {
+            'job': { 'file': { 'name': 'benchmark.gcode', 'origin': 'local' }, 'estimatedPrintTime': 7200 },
+            'progress': { 'completion': completion, 'printTime': step * 2, 'printTimeLeft': int(7200 * (1 - completion / 100.0)) },
+            'state': 'Printing',
+        }
+
+    def connection(self, step):
+        return { 'current': { 'state': 'Printing', 'port': '/dev/ttyACM0', 'baudrate': 115200 } }
+
+    def current(self, step):
+        """The payload of a push "current" message, the same status as the REST responses."""
+        job = self.job(step)
+        temps = self.printer(step)['temperature']
+        temps['time'] = int(time.time())
+        return {
+            'state': { 'text': 'Printing', 'flags': { 'operational': True, 'printing': True, 'paused': False } },
+            'job': job['job'],
+            'progress': job['progress'],
+            'temps': [temps],
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?')[0]
+        if path == '/sockjs/websocket':
+            self._push()
+            return
+
+        step = server.script.advance()
+
+        if server.scenario['drop_every'] and step % server.scenario['drop_every'] == 0:
+            # Hang up without answering
+            self.close_connection = 1
+            return
+
+        if server.scenario['delay']:
+            time.sleep(server.scenario['delay'])
+
+        if server.scenario['fail_every'] and step % server.scenario['fail_every'] == 0:
+            self._send(500, { 'error': 'scripted failure' })
+        elif path == '/api/printer':
+            self._send(200, server.script.printer(step))
+        elif path == '/api/job':
+            self._send(200, server.script.job(step))
+        elif path == '/api/connection':
+            self._send(200, server.script.connection(step))
+        else:
+            self._send(404, { 'error': 'not found' })
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.path == '/api/login':
+            # Session for authenticating the push socket
+            self._send(200, { 'name': '_api', 'session': 'fake' })
+            return
+        self.send_response(204)
+        self.end_headers()
+
+    def _push(self):
+        """Take the websocket upgrade of the push API and push status until the client hangs up."""
+        key = self.headers.get('Sec-WebSocket-Key')
+        if key is None or self.headers.get('Upgrade', '').lower() != 'websocket':
+            self._send(400, { 'error': 'websocket upgrade expected' })
+            return
+
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest()))
+        self.end_headers()
+        self.close_connection = 1
+
+        # Messages from the client (the auth message) are never read
+        try:
+            self._frame({ 'connected': { 'version': 'fake', 'display_version': 'fake' } })
+            while True:
+                self._frame({ 'current': self.server.script.current(self.server.script.advance()) })
+                time.sleep(PUSH_INTERVAL)
+        except socket.error:
+            pass
+
+    def _frame(self, message):
+        """Send message as one unmasked websocket text frame."""
+        data = json.dumps(message)
+        if len(data) < 126:
+            header = struct.pack('!BB', 0x81, len(data))
+        elif len(data) < 65536:
+            header = struct.pack('!BBH', 0x81, 126, len(data))
+        else:
+            header = struct.pack('!BBQ', 0x81, 127, len(data))
+        self.wfile.write(header + data)
+        self.wfile.flush()
+
+    def _send(self, status, body):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOctoPrint(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, scenario='normal'):
+        HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.scenario = SCENARIOS[scenario]
+        self.script = PrinterScript()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+
+def _serve(port, scenario, ready):
+    server = FakeOctoPrint(port, scenario)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_process(scenario='normal', port=0):
+    """Run a FakeOctoPrint in its own process, so it does not count towards
+    the CPU time of the benchmarked process. Returns (process, url)."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(port, scenario, ready))
+    process.daemon = True
+    process.start()
+    return process, 'http://127.0.0.1:{0}'.format(ready.get(timeout=10))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the OctoPrint REST API")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='normal')
+    args = parser.parse_args()
+
+    server = FakeOctoPrint(args.port, args.scenario)
+    print "Fake OctoPrint ({0}) on {1}".format(args.scenario, server.url)
+    server.serve_forever()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Benchmark of the temperature graph in OctoPiPanel.draw().
+
+Compares the frame time of the graph when its static background (area, axes,
+scale) is rendered every frame, as draw() used to do, with blitting the cached
+background, and the old per-sample line drawing of the traces with the
+polylines on the scrolled traces surface. Runs without a display using the
+SDL dummy video driver.
+
+    python benchmarks/graph.py [frames]
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import os
+import sys
+import time
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import pygame
+import tempseries
+from OctoPiPanel import OctoPiPanel
+
+SIZES = ((320, 240), (480, 320))
+
+
+class GraphPrinter(object):
+    """Stands in for the shown Printer, without a thermal watch."""
+    watch = None
+    print_start_sample = 0
+
+
+class GraphPanel(OctoPiPanel):
+    """OctoPiPanel with only what _draw_graph() needs set up."""
+
+    def __init__(self, width, height):
+        self.win_width = width
+        self.win_height = height
+        self.graph_area_width = width - self.graph_area_left - 5
+        self.graph_area_height = height - self.graph_area_top - 5
+        self.graph_rect = pygame.Rect(0, self.graph_area_top - 6, width, height - self.graph_area_top + 6)
+        self.screen = pygame.display.set_mode((width, height))
+        self.color_bg = pygame.Color(41, 61, 70)
+
+        fontPath = os.path.join(self.scriptDirectory, "Cyberbit.ttf")
+        self.fntTextSmall = pygame.font.Font(fontPath if os.path.exists(fontPath) else None, 10)
+        self.fntTextSmall.set_bold(True)
+
+        self.graph_scale = 250
+        self.graph_window = 0
+        self.updatetime = 2000
+        self.graph_background = None
+        self.graph_background_key = None
+        self.printer = GraphPrinter()
+        self.temps = tempseries.SeriesRegistry(self.graph_area_width)
+        for i in range(self.graph_area_width):
+            self.add_sample(i)
+
+        self.graph_traces = None
+        self.graph_traces_rect = None
+        self.graph_traces_key = None
+        self.graph_traces_version = 0
+
+    def add_sample(self, i):
+        self.temps.update((('tool0', (i * 7) % 230, 210.0), ('bed', (i * 3) % 90, 60.0)))
+        self.temps.append()
+
+
+def frame_time(panel, frames, cached):
+    """Return ms per frame for the whole graph."""
+    start = time.time()
+    for i in range(frames):
+        if not cached:
+            # Forces the background to be rendered again, like every frame before
+            panel.graph_background_key = None
+        panel._draw_graph()
+    return (time.time() - start) / frames * 1000.0
+
+
+def layer_time(panel, frames, cached):
+    """Return ms per frame for the static layer alone."""
+    start = time.time()
+    for i in range(frames):
+        if cached:
+            background = panel.graph_background
+        else:
+            background = panel._build_graph_background()
+        panel.screen.blit(background, panel.graph_rect)
+    return (time.time() - start) / frames * 1000.0
+
+
+def legacy_traces(panel, g_scale):
+    """The traces as draw() used to render them, one line per sample."""
+    for series in panel.temps:
+        i = 0
+        for t in series.history.series(0):
+            x = panel.graph_area_left + i
+            y = panel.graph_area_top + panel.graph_area_height - int(t * g_scale)
+            pygame.draw.line(panel.screen, series.color, [x, y], [x + 1, y], 2)
+            i += 1
+
+
+def trace_time(panel, frames, mode):
+    """Return ms per frame for the traces with a new sample every frame."""
+    g_scale = panel.graph_area_height / float(panel.graph_scale)
+    start = time.time()
+    for i in range(frames):
+        panel.add_sample(i)
+        if mode == 'legacy':
+            legacy_traces(panel, g_scale)
+            continue
+        if mode == 'polyline':
+            # Forces a redraw of the whole traces instead of scrolling
+            panel.graph_traces_key = None
+        panel._update_graph_traces(g_scale)
+        panel.screen.blit(panel.graph_traces, panel.graph_traces_rect)
+    return (time.time() - start) / frames * 1000.0
+
+
+def report(name, before, after):
+    print "  {0}: {1:.3f} ms/frame before, {2:.3f} ms/frame after ({3:.0f}% less)".format(
+        name, before, after, 100.0 * (before - after) / before)
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    pygame.init()
+
+    for width, height in SIZES:
+        panel = GraphPanel(width, height)
+        print "{0}x{1}".format(width, height)
+        report("graph", frame_time(panel, frames, False), frame_time(panel, frames, True))
+        report("static layer", layer_time(panel, frames, False), layer_time(panel, frames, True))
+        legacy = trace_time(panel, frames, 'legacy')
+        report("traces, polyline", legacy, trace_time(panel, frames, 'polyline'))
+        report("traces, scrolled", legacy, trace_time(panel, frames, 'scrolled'))
+
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Benchmark of the OctoPiPanel render and poll loop.
+
+Runs a headless OctoPiPanel against a fake OctoPrint (see fake_octoprint.py)
+for every combination of window size, update rate and server scenario, and
+reports loop iterations per second, frames drawn, p50/p99 frame time, p50/p99
+poll latency and the CPU used by the panel process. Frames are not capped,
+so the CPU figure shows the cost of running flat out. Status is polled once
+per update interval, so the poll percentiles need a longer --duration to
+mean much; they show n/a when no poll finished.
+
+    python benchmarks/panel.py [--duration 5] [--sizes 320x240,480x320]
+        [--rates 2000,500] [--scenarios normal,slow,failing]
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import os
+import sys
+import time
+import argparse
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import pygame
+import statepoller
+import fake_octoprint
+from OctoPiPanel import OctoPiPanel
+
+
+def percentile(values, p):
+    """Return the p-th percentile of values, None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def milliseconds(seconds):
+    """Format seconds as ms, n/a when nothing was measured."""
+    if seconds is None:
+        return "n/a"
+    return "{0:.1f}".format(seconds * 1000.0)
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(url, width, height, rate, duration):
+    """Drive one headless panel for duration seconds, return its numbers."""
+    OctoPiPanel.cfg.set('settings', 'baseurl', url)
+    OctoPiPanel.updatetime = rate
+
+    # Time every poll of the background thread. The panel starts polling
+    # while it is set up, so the class is wrapped before it is created and
+    # stays wrapped until the panel stopped.
+    polls = []
+    poll = statepoller.StatePoller.poll
+    def timed_poll(self, *args):
+        start = time.time()
+        poll(self, *args)
+        polls.append(time.time() - start)
+    statepoller.StatePoller.poll = timed_poll
+    try:
+        frames, drawn, wall, cpu = drive(width, height, duration)
+    finally:
+        statepoller.StatePoller.poll = poll
+
+    return {
+        'fps': len(frames) / wall,
+        'draws': drawn,
+        'frame_p50': percentile(frames, 50) * 1000.0,
+        'frame_p99': percentile(frames, 99) * 1000.0,
+        'poll_p50': percentile(polls, 50),
+        'poll_p99': percentile(polls, 99),
+        'polls': len(polls),
+        'cpu': 100.0 * cpu / wall,
+    }
+
+
+def drive(width, height, duration):
+    """Run the loop of a new headless panel, return frame times, frames drawn, wall and CPU seconds."""
+    panel = OctoPiPanel("OctoPiPanel benchmark", headless=True, width=width, height=height)
+    panel.max_fps = 0 # no frame cap, measure what the loop can do
+
+    frames = []
+    drawn = 0
+    cpu = cpu_seconds()
+    start = time.time()
+    while time.time() - start < duration:
+        frameStart = time.time()
+        if panel.run_frame():
+            drawn += 1
+        frames.append(time.time() - frameStart)
+    wall = time.time() - start
+    cpu = cpu_seconds() - cpu
+
+    for printer in panel.printers:
+        printer.stop()
+    pygame.quit()
+
+    return frames, drawn, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the OctoPiPanel render and poll loop")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per configuration")
+    parser.add_argument('--sizes', default='320x240,480x320')
+    parser.add_argument('--rates', default='2000,500', help="updatetime values in ms")
+    parser.add_argument('--scenarios', default='normal,slow,failing')
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in size.split('x')) for size in args.sizes.split(',')]
+    rates = [int(rate) for rate in args.rates.split(',')]
+
+    print "{0:<9} {1:>6} {2:<8} {3:>8} {4:>7} {5:>9} {6:>9} {7:>9} {8:>9} {9:>6} {10:>6}".format(
+        "size", "update", "server", "fps", "draws", "frame p50", "frame p99", "poll p50", "poll p99", "polls", "cpu %")
+
+    for scenario in args.scenarios.split(','):
+        process, url = fake_octoprint.start_process(scenario)
+        try:
+            for width, height in sizes:
+                for rate in rates:
+                    r = run(url, width, height, rate, args.duration)
+                    print "{0:<9} {1:>6} {2:<8} {3:>8.0f} {4:>7} {5:>9.3f} {6:>9.3f} {7:>9} {8:>9} {9:>6} {10:>6.1f}".format(
+                        "{0}x{1}".format(width, height), rate, scenario, r['fps'], r['draws'], r['frame_p50'], r['frame_p99'],
+                        milliseconds(r['poll_p50']), milliseconds(r['poll_p99']), r['polls'], r['cpu'])
+        finally:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
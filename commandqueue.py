@@ -0,0 +1,160 @@
+"""
+CommandQueue for OctoPiPanel
+
+Sends button commands to OctoPrint from a background thread, so a slow or
+unreachable OctoPrint never freezes the touch screen. Repeated taps still
+waiting in the queue are coalesced into one command, commands that could not
+be sent within the timeout are dropped, and every finished command is handed
+back to the main loop to show how it went.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import time
+import threading
+import requests
+from collections import deque
+
+
+def merge_jog(old, new):
+    """Coalesce two jog commands into one move of both distances."""
+    data = dict(old)
+    for axis in ('x', 'y', 'z'):
+        data[axis] = old.get(axis, 0) + new.get(axis, 0)
+    return data
+
+
+def merge_targets(old, new):
+    """Coalesce two commands setting tool targets into one setting all of them."""
+    data = dict(old)
+    data['targets'] = dict(old['targets'])
+    data['targets'].update(new['targets'])
+    return data
+
+
+def merge_replace(old, new):
+    """Coalesce two commands setting something, the last one wins."""
+    return new
+
+
+class Command(object):
+    """
+    @var label: what the command does, shown when it finished
+    @var count: number of taps coalesced into this command
+    @var error: why the command failed, None if it was sent fine
+    @var finished: time.time() when the command was sent or given up, None before
+    """
+
+    def __init__(self, path, data, label, merge=None):
+        """
+        merge is a function(old data, new data) returning the data of one
+        command doing both, e.g. merge_jog, or None to never coalesce.
+        """
+        self.path = path
+        self.data = data
+        self.label = label
+        self.merge = merge
+        self.key = (path, data.get('command'))
+        self.queued = time.time()
+        self.count = 1
+        self.error = None
+        self.finished = None
+
+
+class CommandQueue(threading.Thread):
+
+    def __init__(self, client, poller=None, timeout=10.0):
+        """
+        client is the OctoPrintClient commands are posted with. After every
+        successful command the poller, if given, is asked to poll everything
+        at once. timeout is given in seconds, both for sending a command and
+        for how long it may wait in the queue.
+        """
+        threading.Thread.__init__(self, name="CommandQueue")
+        self.daemon = True
+
+        self.client = client
+        self.poller = poller
+        self.timeout = timeout
+
+        self._pending = deque()
+        self._done = deque()
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def submit(self, path, data, label, merge=None):
+        """Queue a command, return the Command it ended up in. Never blocks."""
+        command = Command(path, data, label, merge)
+        with self._lock:
+            last = self._pending[-1] if self._pending else None
+            if merge is not None and last is not None and last.merge is merge and last.key == command.key:
+                # Still not sent, do both taps at once
+                last.data = merge(last.data, data)
+                last.label = label
+                last.count += 1
+                return last
+            self._pending.append(command)
+
+        self._wake_event.set()
+        return command
+
+    def results(self):
+        """Return the commands finished since the last call, oldest first."""
+        done = []
+        while self._done:
+            done.append(self._done.popleft())
+        return done
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait()
+            self._wake_event.clear()
+
+            command = self._next()
+            while command is not None and not self._stop_event.is_set():
+                try:
+                    self.send(command)
+                except Exception as e:
+                    # Fail this command only, the ones after it still go out
+                    command.error = "Failed: {0!r}".format(e)
+                    command.finished = time.time()
+                    print "Command Error: {0!r}".format(e)
+                self._done.append(command)
+                command = self._next()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def _next(self):
+        with self._lock:
+            if self._pending:
+                return self._pending.popleft()
+            return None
+
+    def send(self, command):
+        """Post command to OctoPrint, recording how it went."""
+        if time.time() - command.queued > self.timeout:
+            command.error = "Timed out in queue"
+        else:
+            try:
+                req = self.client.post(command.path, command.data, timeout=self.timeout)
+                if req.status_code >= 400:
+                    command.error = "{0} {1}".format(req.status_code, req.reason)
+            except requests.exceptions.ConnectionError:
+                command.error = "Connection Error"
+            except requests.exceptions.Timeout:
+                command.error = "Timeout"
+            except requests.exceptions.RequestException as e:
+                command.error = "Request Error: {0}".format(e)
+
+        if command.error is not None:
+            # Encoded, labels hold file names and stdout may not be UTF-8
+            print u"Command Error ({0}): {1}".format(command.label, command.error).encode('utf-8')
+        elif self.poller is not None:
+            # Show the effect of the command without waiting for the slow endpoints
+            self.poller.refresh()
+
+        command.finished = time.time()
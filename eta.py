@@ -0,0 +1,170 @@
+"""
+EtaEstimator for OctoPiPanel
+
+Estimates when the current print is done. The time left reported by
+OctoPrint jumps around and is often missing, so the estimate follows the
+progress of the print itself: an exponentially weighted average of the
+completion rate, weighted by the time between snapshots so irregular polls
+do not skew it. Early in a print that rate says little, so the estimate
+leans on how long the same file took on the same printer before, or else on
+OctoPrint's own estimate, and trusts the rate more the further the print
+gets. Every update takes constant time.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import math
+import json
+
+# Durations of earlier prints, next to the probe cache
+DEFAULT_HISTORY = '/var/tmp/octopipanel-eta.json'
+
+# Completion at which a print counts as finished rather than aborted
+FINISHED = 99.9
+
+
+class PrintHistory(object):
+    """
+    @var durations: seconds the prints of a file took, as {printer: {file: seconds}}
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY):
+        """path is the JSON file the durations are kept in, None keeps them in memory only."""
+        self.path = path
+        self.durations = {}
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self.durations = json.load(f)
+            except (IOError, ValueError):
+                pass
+
+    def duration(self, printer, filename):
+        """Return the seconds printing filename took on printer, None if it was never printed."""
+        return self.durations.get(printer, {}).get(filename)
+
+    def record(self, printer, filename, duration):
+        """Remember a finished print, averaged with the earlier ones of the file."""
+        files = self.durations.setdefault(printer, {})
+        old = files.get(filename)
+        files[filename] = duration if old is None else (old + duration) / 2.0
+
+        if self.path is not None:
+            try:
+                with open(self.path, 'w') as f:
+                    json.dump(self.durations, f)
+            except IOError as e:
+                print "Print history error: {0}".format(e)
+
+
+class EtaEstimator(object):
+    """
+    @var filename: file of the print followed, None between prints
+    @var elapsed: seconds spent printing it, pauses left out
+    @var rate: smoothed completion rate in percent per second, None until known
+    @var finish: smoothed time.time() at which the print is done, None if unknown
+    @var paused_at: time.time() the print was paused, None while it runs
+    """
+
+    def __init__(self, name, history=None, smoothing=300.0, settle=60.0):
+        """
+        name - printer the history of finished prints is kept under
+        history - PrintHistory, None to go without one
+        smoothing - time constant in seconds of the completion rate average
+        settle - time constant in seconds of the finish time, so a new
+            estimate moves it gradually instead of in a jump
+        """
+        self.name = name
+        self.history = history
+        self.smoothing = smoothing
+        self.settle = settle
+        self.reset()
+
+    def reset(self):
+        self.filename = None
+        self.elapsed = 0.0
+        self.rate = None
+        self.finish = None
+        self.prior = None
+        self.last_time = None
+        self.last_completion = 0.0
+        self.last_printing = False
+        self.paused_at = None
+
+    def update(self, now, state):
+        """Take over a new snapshot (a PrinterState) taken at time.time() now."""
+        completion = state.Completion if state.JobLoaded and state.Completion is not None else None
+
+        if not (state.Printing or state.Paused):
+            # Done or aborted, only a finished print says how long the file takes
+            last = completion if completion is not None else self.last_completion
+            if self.filename is not None and self.history is not None and last >= FINISHED:
+                self.history.record(self.name, self.filename, self.elapsed)
+            self.reset()
+            return
+
+        if state.FileName != self.filename:
+            # A new print, or one already running when the panel started
+            self.reset()
+            self.filename = state.FileName
+            self.elapsed = float(state.PrintTime or 0)
+            self.last_time = now
+            self.last_completion = completion or 0.0
+            self.last_printing = state.Printing
+            if self.history is not None:
+                self.prior = self.history.duration(self.name, self.filename)
+            return
+
+        # The finish moves on by the length of a pause
+        if state.Paused and self.paused_at is None:
+            self.paused_at = now
+        elif not state.Paused and self.paused_at is not None:
+            if self.finish is not None:
+                self.finish += now - self.paused_at
+            self.paused_at = None
+
+        dt = now - self.last_time
+        self.last_time = now
+        if completion is None or dt <= 0:
+            return
+
+        if self.last_printing:
+            self.elapsed += dt
+            sample = (completion - self.last_completion) / dt
+            if self.rate is None:
+                # Start from the average so far once there is something to go by
+                if self.elapsed >= self.settle and completion > 0:
+                    self.rate = completion / self.elapsed
+            else:
+                self.rate += (1 - math.exp(-dt / self.smoothing)) * (sample - self.rate)
+        self.last_completion = completion
+        self.last_printing = state.Printing
+        if self.paused_at is not None:
+            return
+
+        # Blend the rate with the history or OctoPrint, by how far the print got
+        left = None
+        if self.prior is not None:
+            left = max(0.0, self.prior - self.elapsed)
+        elif state.PrintTimeLeft is not None:
+            left = float(state.PrintTimeLeft)
+        if self.rate:
+            measured = max(0.0, 100.0 - completion) / self.rate
+            weight = min(1.0, completion / 100.0)
+            left = measured if left is None else weight * measured + (1 - weight) * left
+        if left is None:
+            return
+
+        if self.finish is None:
+            self.finish = now + left
+        else:
+            self.finish += (1 - math.exp(-dt / self.settle)) * (now + left - self.finish)
+
+    def time_left(self, now):
+        """Return the seconds left of the print at time.time() now, None if unknown."""
+        if self.finish is None:
+            return None
+        if self.paused_at is not None:
+            now = self.paused_at
+        return max(0.0, self.finish - now)
@@ -0,0 +1,101 @@
+"""
+FileIndex for OctoPiPanel
+
+Keeps the list of G-code files OctoPrint has, for the file browser. The list
+is fetched from /api/files in a background thread, so hundreds of files
+never stall the touch screen, and only when asked to: when the browser opens
+and every interval seconds while it stays open. The request is conditional,
+so an unchanged list is neither downloaded nor decoded again, and the panel
+keeps the last list to show at once.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import threading
+import requests
+from collections import namedtuple
+
+FILES_PATH = '/api/files?recursive=true'
+
+# A printable file. estimate is the print time in seconds from the analysis of
+# OctoPrint, date the upload time, both None if unknown.
+FileEntry = namedtuple('FileEntry', ('origin', 'path', 'name', 'size', 'date', 'estimate'))
+
+
+def parse_files(data):
+    """Return a FileEntry of every G-code file of an /api/files response, newest first."""
+    entries = []
+    folders = [data.get('files', [])]
+    while folders:
+        for item in folders.pop():
+            if item.get('type') == 'folder':
+                folders.append(item.get('children', []))
+            elif item.get('type') == 'machinecode':
+                analysis = item.get('gcodeAnalysis') or {}
+                entries.append(FileEntry(item['origin'], item.get('path', item['name']), item.get('display', item['name']),
+                                         item.get('size'), item.get('date'), analysis.get('estimatedPrintTime')))
+
+    entries.sort(key=lambda entry: (entry.date is None, -(entry.date or 0), entry.name.lower()))
+    return tuple(entries)
+
+
+class FileIndex(threading.Thread):
+    """
+    @var files: FileEntry of every file, newest first, replaced as a whole
+    @var version: bumped whenever files changed
+    @var error: why the last refresh failed, None if it went fine
+    """
+
+    def __init__(self, client, interval=30.0):
+        """client is the OctoPrintClient, interval in seconds between refreshes while watched."""
+        threading.Thread.__init__(self, name="FileIndex")
+        self.daemon = True
+        self.client = client
+        self.interval = interval
+
+        self.files = ()
+        self.version = 0
+        self.error = None
+        self.watching = False
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def watch(self, watching):
+        """Refresh now and every interval while watching, e.g. while the browser is shown."""
+        self.watching = watching
+        if watching:
+            self._wake_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.interval if self.watching else None)
+            self._wake_event.clear()
+            if self.watching and not self._stop_event.is_set():
+                self.refresh()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def refresh(self):
+        """Fetch the list of files, unless it did not change."""
+        try:
+            response = self.client.get_json(FILES_PATH)
+            if response.status_code != 200:
+                self.error = "{0}".format(response.status_code)
+            else:
+                if response.changed or not self.version:
+                    self.files = parse_files(response.data)
+                    self.version += 1
+                self.error = None
+        except requests.exceptions.ConnectionError:
+            self.error = "Connection Error"
+        except requests.exceptions.Timeout:
+            self.error = "Timeout"
+        except requests.exceptions.RequestException as e:
+            self.error = "Request Error: {0}".format(e)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.error = "Bad response"
+            print "Bad file list from OctoPrint: {0}".format(e)
+            self.client.forget(FILES_PATH)
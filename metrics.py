@@ -0,0 +1,199 @@
+"""
+Metrics for OctoPiPanel
+
+Collects how the panel is doing: time spent in every phase of the main loop,
+latency of every OctoPrint endpoint and how many status polls failed or ran
+late. The numbers can be served in the Prometheus text format over HTTP,
+written to a JSON file, and shown on screen by the panel.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """
+    @var recent: exponentially weighted average of the latest observations
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+            self.recent = value if self.count == 1 else self.recent * 0.9 + value * 0.1
+
+    def cumulative(self):
+        """Return (upper bound, count) pairs as Prometheus wants them."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def as_dict(self):
+        return {
+            'count': self.count, 'sum': self.sum, 'max': self.max, 'recent': self.recent,
+            'buckets': [[str(bound), count] for bound, count in self.cumulative()],
+        }
+
+
+class Metrics(object):
+    """
+    @var phases: Histogram per main loop phase
+    @var http: Histogram per OctoPrint endpoint
+    @var counters: named counters, e.g. polls, polls_failed, polls_late
+    @var gauges: named callables returning the current value of something
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.http = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the with-block as main loop phase name."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._histogram(self.phases, name).observe(time.time() - start)
+
+    def observe_http(self, endpoint, seconds):
+        self._histogram(self.http, endpoint).observe(seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _histogram(self, histograms, name):
+        histogram = histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(name, Histogram())
+        return histogram
+
+    def as_dict(self):
+        return {
+            'phases': dict((name, h.as_dict()) for name, h in self.phases.items()),
+            'http': dict((name, h.as_dict()) for name, h in self.http.items()),
+            'counters': dict(self.counters),
+            'gauges': dict((name, gauge()) for name, gauge in self.gauges.items()),
+        }
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        for metric, label, histograms in (('octopipanel_phase_seconds', 'phase', self.phases),
+                                          ('octopipanel_http_seconds', 'endpoint', self.http)):
+            lines.append('# TYPE {0} histogram'.format(metric))
+            for name in sorted(histograms):
+                h = histograms[name]
+                for bound, count in h.cumulative():
+                    lines.append('{0}_bucket{{{1}="{2}",le="{3}"}} {4}'.format(metric, label, name, bound, count))
+                lines.append('{0}_sum{{{1}="{2}"}} {3}'.format(metric, label, name, h.sum))
+                lines.append('{0}_count{{{1}="{2}"}} {3}'.format(metric, label, name, h.count))
+
+        for name in sorted(self.counters):
+            lines.append('# TYPE octopipanel_{0}_total counter'.format(name))
+            lines.append('octopipanel_{0}_total {1}'.format(name, self.counters[name]))
+
+        for name in sorted(self.gauges):
+            lines.append('# TYPE octopipanel_{0} gauge'.format(name))
+            lines.append('octopipanel_{0} {1}'.format(name, self.gauges[name]()))
+
+        return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, contentType = self.server.metrics.to_prometheus(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, contentType = self.server.metrics.to_json(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(threading.Thread):
+    """Serves /metrics (Prometheus) and /metrics.json on a port."""
+
+    def __init__(self, metrics, port, host=''):
+        threading.Thread.__init__(self, name="MetricsServer")
+        self.daemon = True
+        self.server = HTTPServer((host, port), _Handler)
+        self.server.metrics = metrics
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsWriter(threading.Thread):
+    """Writes the metrics as JSON to a file every interval ms."""
+
+    def __init__(self, metrics, path, interval):
+        threading.Thread.__init__(self, name="MetricsWriter")
+        self.daemon = True
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval / 1000.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            with open(self.path, 'w') as f:
+                f.write(self.metrics.to_json())
+        except IOError as e:
+            print "Metrics error: {0}".format(e)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,150 @@
+"""
+OctoPrintClient for OctoPiPanel
+
+A thin wrapper around one persistent requests.Session shared by every call
+OctoPiPanel makes to the OctoPrint REST API. Connections are pooled and kept
+alive between polls and button commands, and every request gets a timeout
+and (for idempotent requests) a retry/backoff policy.
+
+JSON status requests are made conditional: ETag and Last-Modified validators
+are sent back when OctoPrint provides them, and a body identical to the last
+one (compared by a hash of its raw bytes) is not decoded again.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import json
+import time
+import hashlib
+import requests
+from collections import namedtuple
+from requests.adapters import HTTPAdapter
+
+try:
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError:
+    from urllib3.util.retry import Retry
+
+# Result of get_json, data is the decoded body (None unless status_code is 200),
+# changed is False when the body is the same as the previous one, text is the
+# body of an error response.
+JsonResponse = namedtuple('JsonResponse', ('status_code', 'data', 'changed', 'text'))
+
+# What get_json remembers of the last 200 response for a path
+_CacheEntry = namedtuple('_CacheEntry', ('etag', 'modified', 'digest', 'data'))
+
+
+class OctoPrintClient(object):
+
+    def __init__(self, baseurl, apikey, timeout=5.0, retries=2, backoff=0.3, poolsize=4):
+        """
+        baseurl - URL to the OctoPrint installation, e.g. http://localhost:5000
+        apikey - OctoPrint API key, sent in the X-Api-Key header
+        timeout - seconds to wait for connect and for each read
+        retries - times a failed GET is retried before giving up
+        backoff - backoff factor in seconds between retries
+        poolsize - number of connections kept alive to OctoPrint
+        """
+        self.baseurl = baseurl.rstrip('/')
+        self.apikey = apikey
+        self.timeout = timeout
+        self._cache = {}
+
+        # Set to a Metrics object to record the latency of every endpoint
+        self.metrics = None
+
+        # POST is left out of the retry policy on purpose, a jog or a
+        # print start must never be sent twice.
+        retry = Retry(total=retries, connect=retries, read=retries,
+                      backoff_factor=backoff, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update({ 'X-Api-Key': apikey })
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_config(cls, cfg, section='settings'):
+        """Create a client from a section of OctoPiPanel.cfg, options
+        missing there are taken from [settings]."""
+        def option(name, getter, default):
+            for s in (section, 'settings'):
+                if cfg.has_option(s, name):
+                    return getter(s, name)
+            return default
+
+        return cls(cfg.get(section, 'baseurl'),
+                   cfg.get(section, 'apikey'),
+                   timeout=option('timeout', cfg.getfloat, 5.0),
+                   retries=option('retries', cfg.getint, 2),
+                   backoff=option('retry_backoff', cfg.getfloat, 0.3),
+                   poolsize=option('pool_size', cfg.getint, 4))
+
+    def url(self, path):
+        return self.baseurl + path
+
+    def get(self, path, **kwargs):
+        return self._request('GET', path, **kwargs)
+
+    def post(self, path, data, **kwargs):
+        headers = { 'content-type': 'application/json' }
+        return self._request('POST', path, data=json.dumps(data), headers=headers, **kwargs)
+
+    def get_json(self, path):
+        """
+        GET path and decode its JSON body, skipping the download with
+        If-None-Match/If-Modified-Since and the decoding with a hash of the
+        body when nothing changed since the last call. Returns a JsonResponse,
+        304 Not Modified is returned as 200 with the previous data.
+        """
+        cached = self._cache.get(path)
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.modified:
+                headers['If-Modified-Since'] = cached.modified
+
+        req = self.get(path, headers=headers)
+        if req.status_code == 304 and cached is not None:
+            self._count('responses_unchanged')
+            return JsonResponse(200, cached.data, False, '')
+        if req.status_code != 200:
+            return JsonResponse(req.status_code, None, True, req.text)
+
+        digest = hashlib.sha1(req.content).digest()
+        if cached is not None and digest == cached.digest:
+            self._count('responses_unchanged')
+            data, changed = cached.data, False
+        else:
+            data, changed = json.loads(req.content), True
+
+        self._cache[path] = _CacheEntry(req.headers.get('ETag'), req.headers.get('Last-Modified'), digest, data)
+        return JsonResponse(200, data, changed, '')
+
+    def forget(self, path):
+        """Make the next get_json of path fetch and decode the body again."""
+        self._cache.pop(path, None)
+
+    def _count(self, name):
+        if self.metrics is not None:
+            self.metrics.count(name)
+
+    def _request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.metrics is None:
+            return self.session.request(method, self.url(path), **kwargs)
+
+        start = time.time()
+        try:
+            return self.session.request(method, self.url(path), **kwargs)
+        except requests.exceptions.RequestException:
+            self.metrics.count('http_errors')
+            raise
+        finally:
+            self.metrics.observe_http('{0} {1}'.format(method, path), time.time() - start)
+
+    def close(self):
+        self.session.close()
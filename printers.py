@@ -0,0 +1,204 @@
+"""
+Printers for OctoPiPanel
+
+Everything OctoPiPanel keeps per OctoPrint instance: the client, the
+background status poller, the optional push listener, the queue of button
+commands, the temperature history with its thermal watch, the finish time
+estimate, the list of files, the print queue and the optional telemetry log.
+OctoPiPanel.cfg either describes one printer in [settings], or any number of
+them in [printer:<name>] sections, e.g.
+
+    [printer:Prusa 1]
+    baseurl = http://192.168.0.111:5000
+    apikey = ...
+
+Every printer section may also set timeout, retries, retry_backoff,
+pool_size, command_timeout, push, push_url and
+poll_printer/poll_job/poll_connection,
+anything not set there is taken from [settings].
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import os
+import time
+import threading
+import eta
+import telemetry
+import fileindex
+import printqueue
+import octoclient
+import commandqueue
+import thermalwatch
+import tempseries
+import statepoller
+import pushlistener
+
+SECTION_PREFIX = 'printer:'
+
+
+class Printer(object):
+    """
+    @var name: shown on the overview screen
+    @var state_seq: seq of the last snapshot taken over by update()
+    @var printing: whether that snapshot was printing or paused
+    @var print_start_sample: temps.samples when the current print started
+    """
+
+    def __init__(self, name, client, poller, commands, temps, listener=None, log=None, history=None, watch=None, autostart=False):
+        """
+        history is the PrintHistory the finish time estimate learns from and
+        watch the ThermalWatch checking every temperature sample, None for none.
+        autostart starts the next file of the print queue as soon as a print
+        finished, instead of only selecting it.
+        """
+        self.name = name
+        self.client = client
+        self.poller = poller
+        self.commands = commands
+        self.temps = temps
+        self.listener = listener
+        self.log = log
+        self.eta = eta.EtaEstimator(name, history)
+        self.watch = watch
+        self.files = fileindex.FileIndex(client)
+        self.queue = printqueue.PrintQueue(commands, autostart)
+
+        self.state_seq = 0
+        self.printing = False
+        self.history_ticks = 0
+        self.print_start_sample = 0
+
+    def start(self):
+        self.poller.start()
+        self.commands.start()
+        self.files.start()
+        if self.listener is not None:
+            self.listener.start()
+        if self.log is not None:
+            self.log.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the background threads and wait up to timeout seconds for all of them to end."""
+        threads = [thread for thread in (self.poller, self.commands, self.files, self.listener, self.log) if thread is not None]
+        for thread in threads:
+            thread.stop()
+
+        # Threads left running would be torn down with the interpreter
+        deadline = time.time() + timeout
+        for thread in threads:
+            if thread.is_alive():
+                thread.join(max(0.0, deadline - time.time()))
+        self.client.close()
+
+    def update(self, ticks, updatetime):
+        """
+        Take over the latest snapshot of the poller into the finish time
+        estimate and the temperature history, sampled once per updatetime ms.
+        Returns the snapshot.
+        """
+        state = self.poller.state
+
+        if state.seq != self.state_seq:
+            # Remember where the print started for the whole print graph
+            # window, resuming a paused print is no new start
+            printing = state.Printing or state.Paused
+            if printing and not self.printing:
+                self.print_start_sample = self.temps.samples
+
+            # Take the next file of the queue on once a print finished
+            if self.printing and not printing and state.Completion is not None and state.Completion >= eta.FINISHED:
+                self.queue.finished()
+            self.printing = printing
+            self.state_seq = state.seq
+            self.temps.update(state.Temps)
+            self.eta.update(time.time(), state)
+
+        # Save temperatures to history, once per updatetime so the graph keeps
+        # its time scale even when status arrives faster or slower. Nothing is
+        # sampled while OctoPrint does not answer.
+        if self.poller.fresh() and ticks - self.history_ticks >= updatetime:
+            self.history_ticks = ticks
+            self.temps.append()
+            if self.watch is not None:
+                self.watch.update(time.time(), self.temps)
+            if self.log is not None:
+                self.log.append(time.time(), state, self.temps)
+
+        return state
+
+
+def printer_sections(cfg):
+    """Return (name, section) of every [printer:<name>] section, in file order, name as unicode."""
+    # RawConfigParser hands out the bytes of the file, the name ends up in unicode labels
+    return [(section[len(SECTION_PREFIX):].strip().decode('utf-8', 'replace'), section)
+            for section in cfg.sections() if section.startswith(SECTION_PREFIX)]
+
+
+def read_printers(cfg, updatetime, capacity, metrics=None):
+    """
+    Create a Printer for every [printer:<name>] section of cfg, or a single
+    one from [settings] if there are none. capacity is the width of the
+    temperature graph in samples. The pollers of all printers share a
+    semaphore, so at most poll_concurrency (default 4) of them talk to
+    OctoPrint at the same time.
+    """
+    sections = printer_sections(cfg) or [(None, 'settings')]
+
+    # How long earlier prints took, for estimating when a print is done
+    history = eta.PrintHistory(cfg.get('settings', 'eta_history') if cfg.has_option('settings', 'eta_history') else eta.DEFAULT_HISTORY)
+
+    # Whether the print queue starts the next file by itself
+    autostart = cfg.getboolean('settings', 'queue_autostart') if cfg.has_option('settings', 'queue_autostart') else False
+
+    # Thermal watch, on unless turned off
+    watching = cfg.getboolean('settings', 'thermal_watch') if cfg.has_option('settings', 'thermal_watch') else True
+
+    concurrency = cfg.getint('settings', 'poll_concurrency') if cfg.has_option('settings', 'poll_concurrency') else 4
+    semaphore = threading.BoundedSemaphore(concurrency) if len(sections) > 1 else None
+
+    printers = []
+    for name, section in sections:
+        client = octoclient.OctoPrintClient.from_config(cfg, section)
+        client.metrics = metrics
+
+        intervals = statepoller.read_intervals(cfg, updatetime, section)
+        poller = statepoller.StatePoller(client, updatetime, intervals, semaphore)
+        poller.metrics = metrics
+
+        commandSection = section if cfg.has_option(section, 'command_timeout') else 'settings'
+        timeout = cfg.getfloat(commandSection, 'command_timeout') if cfg.has_option(commandSection, 'command_timeout') else 10.0
+        commands = commandqueue.CommandQueue(client, poller, timeout)
+
+        # Optional push mode, the poller takes over whenever the stream drops
+        listener = None
+        pushSection = section if cfg.has_option(section, 'push') else 'settings'
+        if cfg.has_option(pushSection, 'push') and cfg.getboolean(pushSection, 'push'):
+            if pushlistener.websocket is None:
+                print "Push mode needs the websocket-client module, polling instead."
+            else:
+                url = cfg.get(section, 'push_url') if cfg.has_option(section, 'push_url') else None
+                listener = pushlistener.PushListener(client, poller, url, stale=max(5.0, updatetime * 2 / 1000.0))
+
+        # Optional telemetry log, one file per printer, restoring the graph
+        # of the last hour after a restart
+        temps = tempseries.SeriesRegistry(capacity)
+        log = None
+        if cfg.has_option('settings', 'telemetry_log'):
+            path = cfg.get('settings', 'telemetry_log')
+            if name is not None and len(sections) > 1:
+                base, ext = os.path.splitext(path)
+                path = "{0}-{1}{2}".format(base, u"".join(c if c.isalnum() else u'_' for c in name).encode('utf-8'), ext)
+            interval = cfg.getint('settings', 'telemetry_flush') if cfg.has_option('settings', 'telemetry_flush') else 60000
+            try:
+                log = telemetry.TelemetryLog(path, interval)
+                telemetry.restore(path, temps, capacity * temps.spans[1])
+            except (IOError, OSError, ValueError) as e:
+                print "Telemetry error: {0}, not logging".format(e)
+                log = None
+
+        printers.append(Printer(name or cfg.get('settings', 'baseurl'), client, poller, commands,
+                                temps, listener, log, history, thermalwatch.ThermalWatch() if watching else None, autostart))
+
+    return printers
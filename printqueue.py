@@ -0,0 +1,56 @@
+"""
+PrintQueue for OctoPiPanel
+
+Files lined up on the panel to be printed one after the other. When a print
+finishes the next file is selected in OctoPrint, ready for the start button,
+or started right away with queue_autostart. An aborted print stops the
+queue until the next print finishes, so a failed print is never followed by
+another one unattended.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import urllib
+
+
+def file_path(entry):
+    """Return the API path of the FileEntry entry."""
+    return "/api/files/{0}/{1}".format(entry.origin, urllib.quote(entry.path.encode('utf-8')))
+
+
+class PrintQueue(object):
+    """
+    @var entries: FileEntry of every queued file, the next one first
+    """
+
+    def __init__(self, commands, autostart=False):
+        """commands is the CommandQueue the select commands are sent with."""
+        self.commands = commands
+        self.autostart = autostart
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, entry):
+        return entry in self.entries
+
+    def add(self, entry):
+        if entry not in self.entries:
+            self.entries.append(entry)
+
+    def remove(self, entry):
+        if entry in self.entries:
+            self.entries.remove(entry)
+
+    def select(self, entry, start):
+        """Load entry in OctoPrint, and start printing it if start. Returns the Command."""
+        label = u"{0} {1}".format("Print" if start else "Load", entry.name)
+        return self.commands.submit(file_path(entry), { "command": "select", "print": start }, label)
+
+    def finished(self):
+        """Take the next file on after a print finished, returns its Command or None."""
+        if not self.entries:
+            return None
+        return self.select(self.entries.pop(0), self.autostart)
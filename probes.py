@@ -0,0 +1,77 @@
+"""
+Probes for OctoPiPanel
+
+Finds out what display OctoPiPanel runs on: whether X is running, and if
+not whether the display is a RoboPeak USB one. Both answers need a
+subprocess, so they are cached in a file kept across reboots. A cached
+answer is used at once while the probes run again in the background and
+update the cache for the next start.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import json
+import threading
+import subprocess
+
+# Survives reboots, unlike /tmp
+DEFAULT_CACHE = '/var/tmp/octopipanel-probes.json'
+
+
+def _output(args):
+    try:
+        return subprocess.Popen(args, stdout=subprocess.PIPE)
+    except OSError:
+        return None
+
+
+def probe():
+    """Run the probes, in parallel, and return their answers as a dict."""
+    pidof = _output(["pidof", "X"])
+    lsusb = _output('lsusb')
+
+    return {
+        'x_running': pidof is not None and pidof.communicate()[0].strip() != "",
+        'robopeak': lsusb is not None and lsusb.communicate()[0].find('fccf:a001') != -1,
+    }
+
+
+def load(path):
+    """Return the cached answers, or None if there are none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def save(path, results):
+    try:
+        with open(path, 'w') as f:
+            json.dump(results, f)
+    except IOError as e:
+        print "Probe cache error: {0}".format(e)
+
+
+def display_probes(path=DEFAULT_CACHE):
+    """
+    Return the answers of probe(), from the cache at path if there is one.
+    Cached answers are checked again in a background thread.
+    """
+    cached = load(path)
+    if cached is None:
+        results = probe()
+        save(path, results)
+        return results
+
+    def refresh():
+        results = probe()
+        if results != cached:
+            print "Display changed since the last start, restart OctoPiPanel to use it."
+            save(path, results)
+
+    thread = threading.Thread(target=refresh, name="Probes")
+    thread.daemon = True
+    thread.start()
+    return cached
@@ -0,0 +1,151 @@
+"""
+PushListener for OctoPiPanel
+
+Subscribes to the push API of OctoPrint (the raw websocket transport of its
+SockJS endpoint) and feeds every "current" and "history" message into the
+StatePoller snapshot. While the stream is up the poller stops polling; when
+the stream drops or goes quiet the poller takes over again and the listener
+keeps trying to reconnect in the background.
+
+Requires the websocket-client module, without it push mode is unavailable
+and OctoPiPanel keeps polling.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import json
+import socket
+import threading
+import requests
+import statepoller
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+
+def push_url(baseurl):
+    """Return the websocket URL of the push API for an OctoPrint base URL."""
+    if baseurl.startswith('https://'):
+        baseurl = 'wss://' + baseurl[len('https://'):]
+    elif baseurl.startswith('http://'):
+        baseurl = 'ws://' + baseurl[len('http://'):]
+
+    return baseurl.rstrip('/') + '/sockjs/websocket'
+
+
+def parse_push(state, payload):
+    """Return the fields of a push "current" or "history" payload as a dict."""
+    fields = {}
+
+    # Only the latest temperature reading is of interest
+    temps = payload.get('temps')
+    if temps:
+        fields.update(statepoller.parse_printer(state, { 'temps': temps[-1] }))
+
+    printerState = payload.get('state')
+    if printerState:
+        flags = printerState.get('flags', {})
+        fields['Paused'] = bool(flags.get('paused'))
+        fields['Printing'] = bool(flags.get('printing'))
+
+        job = payload.get('job')
+        if job:
+            fileName = job['file']['name']
+            fields['FileName'] = fileName
+            fields['JobLoaded'] = bool(flags.get('operational')) and (fileName != "") or (fileName != None)
+
+    progress = payload.get('progress')
+    if progress:
+        fields['Completion'] = progress['completion']
+        fields['PrintTime'] = progress['printTime']
+        fields['PrintTimeLeft'] = progress['printTimeLeft']
+
+    return fields
+
+
+class PushListener(threading.Thread):
+
+    def __init__(self, client, poller, url=None, stale=5.0, retry=10.0):
+        """
+        client - OctoPrintClient, used to log in for the push session
+        poller - StatePoller which receives the snapshots
+        url - websocket URL, defaults to the push endpoint of the client
+        stale - seconds without a message before falling back to polling
+        retry - seconds between reconnect attempts
+        """
+        threading.Thread.__init__(self, name="PushListener")
+        self.daemon = True
+
+        self.client = client
+        self.poller = poller
+        self.url = url or push_url(client.baseurl)
+        self.stale = stale
+        self.retry = retry
+
+        self._ws = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.listen()
+            except (websocket.WebSocketException, socket.error, requests.exceptions.RequestException) as e:
+                print "Push connection lost: {0}".format(e)
+            except (ValueError, KeyError, TypeError) as e:
+                print "Bad push login from OctoPrint: {0}".format(e)
+            finally:
+                # Fall back to polling until the stream is back
+                self.poller.push_active.clear()
+                self._close()
+
+            self._stop_event.wait(self.retry)
+
+    def stop(self):
+        self._stop_event.set()
+        self._close()
+
+    def listen(self):
+        """Connect and handle messages until the stream drops or stops."""
+        self._ws = websocket.create_connection(self.url, timeout=self.stale)
+        self._authenticate()
+
+        while not self._stop_event.is_set():
+            message = self._ws.recv()
+            if not message:
+                break
+
+            # A bad message is dropped, the stream goes on
+            try:
+                self.handle_message(json.loads(message))
+            except (ValueError, KeyError, TypeError) as e:
+                print "Bad push message from OctoPrint: {0}".format(e)
+
+    def handle_message(self, message):
+        """Publish one decoded push message, returns True if it carried status."""
+        for key in ('current', 'history'):
+            if key in message:
+                self.poller.publish(parse_push(self.poller.state, message[key]))
+                self.poller.push_active.set()
+                return True
+
+        return False
+
+    def _authenticate(self):
+        # OctoPrint 1.3.10 and newer only push to authenticated sockets. Older
+        # versions do not know /api/login and push without it.
+        req = self.client.post('/api/login', { 'passive': True })
+        if req.status_code == 200:
+            user = json.loads(req.text)
+            self._ws.send(json.dumps({ 'auth': '{0}:{1}'.format(user['name'], user['session']) }))
+
+    def _close(self):
+        ws = self._ws
+        self._ws = None
+        if ws is not None:
+            try:
+                ws.close()
+            except (websocket.WebSocketException, socket.error):
+                pass
@@ -36,6 +36,7 @@ authors and should not be interpreted as representing official policies, either
 or implied, of Al Sweigart.
 """
 import pygame
+import textcache
 from pygame.locals import *
 
 pygame.font.init()
@@ -207,7 +208,7 @@ class PygButton(object):
         self.surfaceHighlight.fill(self.bgcolor)
 
         # draw caption text for all buttons
-        captionSurf = self._font.render(self._caption, True, self.fgcolor, self.bgcolor)
+        captionSurf = textcache.cache.render(self._font, self._caption, True, self.fgcolor, self.bgcolor)
         captionRect = captionSurf.get_rect()
         captionRect.center = int(w / 2), int(h / 2)
         self.surfaceNormal.blit(captionSurf, captionRect)
@@ -282,6 +283,8 @@ class PygButton(object):
 
 
     def _propSetCaption(self, captionText):
+        if captionText == self._caption and not self.customSurfaces:
+            return # nothing changed, no need to redraw the surfaces
         self.customSurfaces = False
         self._caption = captionText
         self._update()
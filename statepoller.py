@@ -0,0 +1,324 @@
+"""
+StatePoller for OctoPiPanel
+
+Polls the OctoPrint REST API from a background thread so that slow or hanging
+HTTP requests never stall the pygame main loop. Every finished poll is
+published as an immutable PrinterState snapshot which the main loop can read
+at any time without locking. A new snapshot is only published when some
+field actually changed, and responses identical to the previous poll are not
+parsed again.
+
+Every endpoint has its own interval, which depends on what the printer is
+doing: temperatures are polled fast while printing or heating, the rarely
+changing connection state slowly, and everything slows down while the
+backlight is off.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import time
+import threading
+import requests
+from collections import namedtuple
+
+# Fields mirror the status attributes of OctoPiPanel so a snapshot can be
+# copied straight onto the panel.
+STATE_FIELDS = (
+    'HotEndTemp', 'BedTemp', 'HotEndTempTarget', 'BedTempTarget',
+    'HotHotEnd', 'HotBed', 'Paused', 'Printing', 'JobLoaded',
+    'Completion', 'PrintTime', 'PrintTimeLeft', 'FileName', 'Temps',
+)
+
+PrinterState = namedtuple('PrinterState', ('seq',) + STATE_FIELDS)
+
+EMPTY_STATE = PrinterState(
+    seq=0,
+    HotEndTemp=0.0, BedTemp=0.0, HotEndTempTarget=0.0, BedTempTarget=0.0,
+    HotHotEnd=False, HotBed=False, Paused=False, Printing=False, JobLoaded=False,
+    Completion=0, PrintTime=0, PrintTimeLeft=0, FileName="Nothing", Temps=(),
+)
+
+
+def parse_printer(state, printerState):
+    """Return the fields of a /api/printer response as a dict."""
+    fields = {}
+    tempKey = 'temps' if 'temps' in printerState else 'temperature'
+    temps = printerState[tempKey]
+
+    # Every sensor, as (key, actual, target) sorted by key
+    fields['Temps'] = tuple((key, temps[key]['actual'] or 0.0, temps[key]['target'] or 0.0)
+                            for key in sorted(temps) if isinstance(temps[key], dict) and 'actual' in temps[key])
+
+    if 'tool0' in temps:
+        fields['HotEndTemp'] = temps['tool0']['actual']
+        fields['HotEndTempTarget'] = temps['tool0']['target']
+    else:
+        fields['HotEndTemp'] = state.HotEndTemp
+        fields['HotEndTempTarget'] = state.HotEndTempTarget
+
+    if 'bed' in temps:
+        fields['BedTemp'] = temps['bed']['actual']
+        fields['BedTempTarget'] = temps['bed']['target']
+    else:
+        fields['BedTemp'] = -1
+        fields['BedTempTarget'] = -1
+
+    if fields['HotEndTempTarget'] == None:
+        fields['HotEndTempTarget'] = 0.0
+
+    if fields['BedTempTarget'] == None:
+        fields['BedTempTarget'] = 0.0
+
+    fields['HotHotEnd'] = fields['HotEndTempTarget'] > 0.0
+    fields['HotBed'] = fields['BedTempTarget'] > 0.0
+
+    return fields
+
+
+def parse_job(jobState, connState):
+    """Return the fields of /api/job and /api/connection responses as a dict."""
+    fields = {}
+    fields['Completion'] = jobState['progress']['completion'] # In procent
+    fields['PrintTime'] = jobState['progress']['printTime']
+    fields['PrintTimeLeft'] = jobState['progress']['printTimeLeft']
+    fields['FileName'] = jobState['job']['file']['name']
+    fields['JobLoaded'] = connState['current']['state'] == "Operational" and (jobState['job']['file']['name'] != "") or (jobState['job']['file']['name'] != None)
+    fields['Paused'] = connState['current']['state'] == "Paused"
+    fields['Printing'] = connState['current']['state'] == "Printing"
+
+    return fields
+
+
+ENDPOINTS = ('/api/printer', '/api/job', '/api/connection')
+
+# Polling modes, every endpoint has one interval per mode
+ACTIVE, IDLE, ASLEEP = 0, 1, 2
+
+
+def default_intervals(updatetime):
+    """
+    Return the poll interval in ms of every endpoint while printing or
+    heating, while idle and while the backlight is off. Temperatures follow
+    updatetime, the connection state changes rarely.
+    """
+    return {
+        '/api/printer': (updatetime, updatetime, max(updatetime, 10000)),
+        '/api/job': (updatetime, max(updatetime, 5000), max(updatetime, 30000)),
+        '/api/connection': (max(updatetime, 5000), max(updatetime, 10000), max(updatetime, 60000)),
+    }
+
+
+def read_intervals(cfg, updatetime, section='settings'):
+    """Return default_intervals with the poll_printer, poll_job and
+    poll_connection options of OctoPiPanel.cfg applied, from section or
+    else from [settings]."""
+    intervals = default_intervals(updatetime)
+    for path in ENDPOINTS:
+        option = 'poll_' + path.rsplit('/', 1)[1]
+        for s in (section, 'settings'):
+            if cfg.has_option(s, option):
+                break
+        else:
+            continue
+        values = tuple(int(value) for value in cfg.get(s, option).split(','))
+        if len(values) != 3:
+            raise ValueError("{0} needs three intervals: active, idle, asleep".format(option))
+        intervals[path] = values
+    return intervals
+
+
+class StatePoller(threading.Thread):
+    """
+    @var state: the latest PrinterState, replaced (never mutated) when a poll changed something
+    @var updated: time.time() of the last poll or push message that delivered status, changed or not
+    @var asleep: set with set_asleep while nobody can see the screen
+    """
+
+    def __init__(self, client, interval, intervals=None, semaphore=None):
+        """
+        client is the shared OctoPrintClient, interval is given in
+        milliseconds like updatetime in OctoPiPanel.cfg. intervals maps every
+        endpoint to its (active, idle, asleep) intervals in milliseconds, see
+        default_intervals. A semaphore shared by several pollers bounds how
+        many of them poll at the same time.
+        """
+        threading.Thread.__init__(self, name="StatePoller")
+        self.daemon = True
+
+        self.client = client
+        self.interval = interval / 1000.0
+        if intervals is None:
+            intervals = default_intervals(interval)
+        self.intervals = dict((path, tuple(value / 1000.0 for value in values)) for path, values in intervals.items())
+        self.asleep = False
+        self.semaphore = semaphore
+
+        self.state = EMPTY_STATE
+        self.updated = 0.0
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._publish_lock = threading.Lock()
+
+        # When every endpoint was polled last
+        self._polled = dict((path, 0.0) for path in ENDPOINTS)
+
+        # Set while a PushListener delivers status, polling is paused meanwhile
+        self.push_active = threading.Event()
+
+        # Set to a Metrics object to count polls, failed polls and late polls
+        self.metrics = None
+
+        # Last responses and the fields parsed from them, reused while they are unchanged
+        self._job = None
+        self._conn = None
+        self._printerFields = None
+        self._jobFields = None
+
+    def run(self):
+        while not self._stop_event.is_set():
+            timeout = self.interval
+            if not self.push_active.is_set():
+                due = self.due()
+                if due and self.semaphore is not None:
+                    with self.semaphore:
+                        self.poll(due)
+                elif due:
+                    self.poll(due)
+                timeout = self.next_due()
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def mode(self):
+        """ASLEEP while the backlight is off, else ACTIVE while printing or heating and IDLE otherwise."""
+        if self.asleep:
+            return ASLEEP
+        state = self.state
+        if state.Printing or state.Paused or state.HotHotEnd or state.HotBed:
+            return ACTIVE
+        return IDLE
+
+    def set_asleep(self, asleep):
+        """Slow polling down while nobody looks, and catch up at once on wake up."""
+        if asleep != self.asleep:
+            self.asleep = asleep
+            self._wake_event.set()
+
+    def refresh(self):
+        """Poll every endpoint now, e.g. after a command changed the printer state."""
+        for path in ENDPOINTS:
+            self._polled[path] = 0.0
+        self._wake_event.set()
+
+    def due(self):
+        """Return the endpoints whose interval has passed in the current mode."""
+        mode = self.mode()
+        now = time.time()
+        return [path for path in ENDPOINTS if now - self._polled[path] >= self.intervals[path][mode]]
+
+    def next_due(self):
+        """Return seconds until the next endpoint is due."""
+        mode = self.mode()
+        now = time.time()
+        return max(0.0, min(self._polled[path] + self.intervals[path][mode] for path in ENDPOINTS) - now)
+
+    def fresh(self):
+        """True if status arrived within twice the current /api/printer interval."""
+        return time.time() - self.updated <= 2 * self.intervals['/api/printer'][self.mode()]
+
+    def poll(self, paths=ENDPOINTS):
+        """Fetch status from OctoPrint once, from the given endpoints, and publish a new snapshot."""
+        state = self.state
+        fields = {}
+        failed = False
+        start = time.time()
+        for path in paths:
+            self._polled[path] = start
+
+        try:
+            if '/api/printer' in paths:
+                printer = self.client.get_json('/api/printer')
+                if printer.status_code == 200:
+                    if printer.changed or self._printerFields is None:
+                        self._printerFields = parse_printer(state, printer.data)
+                    fields.update(self._printerFields)
+                else:
+                    failed = True
+                    if printer.status_code == 401:
+                        print "Error: {0}".format(printer.text)
+            elif self._printerFields is not None:
+                fields.update(self._printerFields)
+
+            # Get info about current job
+            if '/api/job' in paths:
+                job = self.client.get_json('/api/job')
+                if job.status_code == 200:
+                    if job.changed or self._job is None:
+                        self._job = job.data
+                        self._jobFields = None
+                else:
+                    failed = True
+
+            if '/api/connection' in paths:
+                conn = self.client.get_json('/api/connection')
+                if conn.status_code == 200:
+                    if conn.changed or self._conn is None:
+                        self._conn = conn.data
+                        self._jobFields = None
+                else:
+                    failed = True
+
+            if self._job is not None and self._conn is not None:
+                if self._jobFields is None:
+                    self._jobFields = parse_job(self._job, self._conn)
+                fields.update(self._jobFields)
+
+        except requests.exceptions.ConnectionError as e:
+            print "Connection Error ({0}): {1}".format(e.errno, e.strerror)
+            failed = True
+        except requests.exceptions.Timeout as e:
+            print "Timeout: {0}".format(e)
+            failed = True
+        except requests.exceptions.RequestException as e:
+            print "Request Error: {0}".format(e)
+            failed = True
+        except (ValueError, KeyError, TypeError) as e:
+            print "Bad response from OctoPrint: {0}".format(e)
+            failed = True
+            # Parse the bodies again next time, even if they stay the same
+            for path in ENDPOINTS:
+                self.client.forget(path)
+            self._job = None
+            self._conn = None
+            self._printerFields = None
+            self._jobFields = None
+
+        self.publish(fields)
+
+        if self.metrics is not None:
+            self.metrics.count('polls')
+            if failed:
+                # Some of the status could not be fetched
+                self.metrics.count('polls_failed')
+            if time.time() - start > self.interval:
+                # Took longer than the time between polls
+                self.metrics.count('polls_late')
+
+    def publish(self, fields):
+        """
+        Publish a new snapshot with fields replaced, unless they all have the
+        values already published. Safe to call from any thread.
+        """
+        if not fields:
+            return
+
+        with self._publish_lock:
+            state = self.state
+            self.updated = time.time()
+            changed = dict((field, value) for field, value in fields.iteritems() if getattr(state, field) != value)
+            if changed:
+                self.state = state._replace(seq=state.seq + 1, **changed)
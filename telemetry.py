@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Telemetry log for OctoPiPanel
+
+Every temperature history sample is also appended to a log file, so nothing
+is lost when it scrolls off the graph and the graph can be restored after
+the panel restarts. The log is a 256 byte header followed by fixed size
+binary records:
+
+    timestamp    double, seconds since the epoch
+    flags        byte, FLAG_PRINTING | FLAG_PAUSED | FLAG_JOB_LOADED
+    completion   float, percent, NaN without a job
+    temps        SLOTS x (actual, target) floats, NaN for an unused slot
+
+The header names the sensor of every slot. Records are collected in memory
+and written in one batch every flush interval, to spare the SD card.
+Readers map the file into memory and unpack only the records they need.
+
+Export the temperatures of a print as CSV:
+
+    python telemetry.py list octopipanel.log
+    python telemetry.py export octopipanel.log --print -1 > print.csv
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import os
+import sys
+import csv
+import mmap
+import struct
+import argparse
+import datetime
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = 'OPPTLOG1'
+HEADER_SIZE = 256
+SLOTS = 6
+KEY_SIZE = 16
+
+FLAG_PRINTING = 1
+FLAG_PAUSED = 2
+FLAG_JOB_LOADED = 4
+
+RECORD = struct.Struct('<dBxf{0}f2x'.format(SLOTS * 2))
+HEADER = struct.Struct('<8sHH' + '{0}s'.format(KEY_SIZE) * SLOTS)
+
+NAN = float('nan')
+
+
+def _isnan(value):
+    return value != value
+
+
+class TelemetryLog(threading.Thread):
+    """Appends records to a log file, flushed from a background thread every interval ms."""
+
+    def __init__(self, path, interval=60000):
+        threading.Thread.__init__(self, name="TelemetryLog")
+        self.daemon = True
+        self.path = path
+        self.interval = interval / 1000.0
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        # Sensor of every slot, taken over from an existing log
+        self.keys = []
+        self._header_dirty = True
+        if os.path.exists(path):
+            try:
+                self.keys = read_header(path)
+                self._header_dirty = False
+            except (IOError, ValueError) as e:
+                # Empty, cut short or unreadable, moved aside for a look and
+                # a new log started. Raises OSError if it cannot be moved.
+                print "Telemetry error: {0}, starting a new log".format(e)
+                os.rename(path, path + '.bad')
+
+    def append(self, timestamp, state, temps):
+        """Queue a record of state (a PrinterState) and temps (a SeriesRegistry). Never blocks on the disk."""
+        flags = 0
+        if state.Printing:
+            flags |= FLAG_PRINTING
+        if state.Paused:
+            flags |= FLAG_PAUSED
+        if state.JobLoaded:
+            flags |= FLAG_JOB_LOADED
+
+        completion = state.Completion if state.JobLoaded and state.Completion is not None else NAN
+        values = [NAN] * (SLOTS * 2)
+        with self._lock:
+            # A new slot and its header go out with the same flush as its record
+            for series in temps:
+                if series.key not in self.keys:
+                    if len(self.keys) >= SLOTS:
+                        continue
+                    self.keys.append(series.key)
+                    self._header_dirty = True
+                slot = self.keys.index(series.key)
+                values[slot * 2] = series.actual
+                values[slot * 2 + 1] = series.target
+            self._pending.append(RECORD.pack(timestamp, flags, completion, *values))
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self._stop_event.set()
+        self.flush()
+
+    def flush(self):
+        """Write the queued records in one go."""
+        with self._lock:
+            records, self._pending = self._pending, []
+            keys = [key.encode('utf-8')[:KEY_SIZE] for key in self.keys]
+            header = HEADER.pack(MAGIC, RECORD.size, SLOTS, *(keys + [''] * (SLOTS - len(keys)))) if self._header_dirty else None
+            self._header_dirty = False
+        if not records and header is None:
+            return
+
+        try:
+            with self._write_lock, open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b') as f:
+                if header is not None:
+                    f.seek(0)
+                    f.write(header.ljust(HEADER_SIZE, '\0'))
+
+                # Drop a record cut short, e.g. by a power cut, to stay aligned
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size > HEADER_SIZE and (size - HEADER_SIZE) % RECORD.size:
+                    f.truncate(size - (size - HEADER_SIZE) % RECORD.size)
+                    f.seek(0, os.SEEK_END)
+
+                f.write(''.join(records))
+                f.flush()
+                os.fsync(f.fileno())
+        except IOError as e:
+            print "Telemetry error: {0}".format(e)
+
+
+def read_header(path):
+    """Return the sensor keys of the slots of the log at path."""
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError("{0} is not an OctoPiPanel telemetry log".format(path))
+    fields = HEADER.unpack(data)
+    if fields[0] != MAGIC or fields[1] != RECORD.size or fields[2] != SLOTS:
+        raise ValueError("{0} is not an OctoPiPanel telemetry log".format(path))
+    return [key.rstrip('\0').decode('utf-8') for key in fields[3:] if key.rstrip('\0')]
+
+
+class TelemetryReader(object):
+    """Read only, memory mapped view of a log. len() is the number of records."""
+
+    def __init__(self, path):
+        self.keys = read_header(path)
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self.count = max(0, (size - HEADER_SIZE) / RECORD.size)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def record(self, index):
+        """Return (timestamp, flags, completion, temps) of record index, temps as (key, actual, target) tuples."""
+        fields = RECORD.unpack_from(self._map, HEADER_SIZE + index * RECORD.size)
+        temps = tuple((key, fields[3 + slot * 2], fields[4 + slot * 2]) for slot, key in enumerate(self.keys)
+                      if not _isnan(fields[3 + slot * 2]))
+        return fields[0], fields[1], fields[2], temps
+
+    def records(self, start=0, stop=None):
+        for index in xrange(start, self.count if stop is None else min(stop, self.count)):
+            yield self.record(index)
+
+    def flags(self):
+        """Return the flags of every record, as a NumPy array when NumPy is there."""
+        if not self.count:
+            return []
+        if numpy is not None:
+            return numpy.frombuffer(self._map, dtype=numpy.uint8, count=self.count * RECORD.size,
+                                    offset=HEADER_SIZE)[8::RECORD.size]
+        return [ord(self._map[HEADER_SIZE + i * RECORD.size + 8]) for i in xrange(self.count)]
+
+    def prints(self):
+        """Return (start, stop) record ranges of every print, a run of printing or paused records."""
+        if numpy is not None and self.count:
+            active = (self.flags() & (FLAG_PRINTING | FLAG_PAUSED)) != 0
+            edges = numpy.diff(numpy.concatenate(([0], active.astype(numpy.int8), [0])))
+            return zip(numpy.flatnonzero(edges == 1).tolist(), numpy.flatnonzero(edges == -1).tolist())
+
+        runs = []
+        start = None
+        for index, flags in enumerate(self.flags()):
+            if flags & (FLAG_PRINTING | FLAG_PAUSED):
+                if start is None:
+                    start = index
+            elif start is not None:
+                runs.append((start, index))
+                start = None
+        if start is not None:
+            runs.append((start, self.count))
+        return runs
+
+
+def restore(path, temps, samples):
+    """Replay the last samples records of the log at path into temps, a SeriesRegistry."""
+    if not os.path.exists(path):
+        return
+    try:
+        reader = TelemetryReader(path)
+    except (IOError, ValueError) as e:
+        print "Telemetry error: {0}".format(e)
+        return
+
+    try:
+        for timestamp, flags, completion, sample in reader.records(max(0, len(reader) - samples)):
+            temps.update(sample)
+            temps.append()
+    finally:
+        reader.close()
+
+
+def export_csv(reader, out, start=0, stop=None):
+    writer = csv.writer(out)
+    header = ['time', 'printing', 'paused', 'completion']
+    for key in reader.keys:
+        header += [key + '_actual', key + '_target']
+    writer.writerow(header)
+
+    for timestamp, flags, completion, temps in reader.records(start, stop):
+        values = dict((key, (actual, target)) for key, actual, target in temps)
+        row = [datetime.datetime.fromtimestamp(timestamp).isoformat(),
+               int(bool(flags & FLAG_PRINTING)), int(bool(flags & FLAG_PAUSED)),
+               '' if _isnan(completion) else '{0:.1f}'.format(completion)]
+        for key in reader.keys:
+            if key in values:
+                row += ['{0:.1f}'.format(values[key][0]), '{0:.1f}'.format(values[key][1])]
+            else:
+                row += ['', '']
+        writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read OctoPiPanel telemetry logs")
+    commands = parser.add_subparsers(dest='command')
+    listParser = commands.add_parser('list', help="list the prints in a log")
+    listParser.add_argument('log')
+    exportParser = commands.add_parser('export', help="write records as CSV to stdout")
+    exportParser.add_argument('log')
+    exportParser.add_argument('--print', type=int, dest='print_', metavar='N', help="only print N of list, -1 for the last one")
+    args = parser.parse_args()
+
+    reader = TelemetryReader(args.log)
+    try:
+        if args.command == 'list':
+            for i, (start, stop) in enumerate(reader.prints()):
+                first = reader.record(start)[0]
+                last = reader.record(stop - 1)[0]
+                print "{0:>4}  {1}  {2:>8}  {3:>6} samples".format(
+                    i, datetime.datetime.fromtimestamp(first).strftime('%Y-%m-%d %H:%M'),
+                    datetime.timedelta(seconds=int(last - first)), stop - start)
+        elif args.print_ is not None:
+            start, stop = reader.prints()[args.print_]
+            export_csv(reader, sys.stdout, start, stop)
+        else:
+            export_csv(reader, sys.stdout)
+    finally:
+        reader.close()
+
+
+if __name__ == '__main__':
+    main()
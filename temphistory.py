@@ -0,0 +1,113 @@
+"""
+TempHistory for OctoPiPanel
+
+Temperature history kept in preallocated array('f') ring buffers. The most
+recent samples are stored at full resolution and every tier above that keeps
+the min, max and mean of a growing number of samples per point, so hours of
+history fit in a few kilobytes and switching the time window of the graph
+never reallocates anything.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+from array import array
+
+
+class RingBuffer(object):
+    """Fixed size ring of floats, starts out filled with zeros."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = array('f', [0.0]) * capacity
+        self._head = 0 # index of the oldest value, the next one to be overwritten
+
+    def append(self, value):
+        self._data[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+
+    def values(self):
+        """Return all values, oldest first."""
+        return self._data[self._head:].tolist() + self._data[:self._head].tolist()
+
+    def tail(self, count):
+        """Return the newest count values, oldest first."""
+        count = min(count, self.capacity)
+        start = (self._head - count) % self.capacity
+        if start + count <= self.capacity:
+            return self._data[start:start + count].tolist()
+        return self._data[start:].tolist() + self._data[:(start + count) % self.capacity].tolist()
+
+    def __len__(self):
+        return self.capacity
+
+
+class Tier(object):
+    """min, max and mean of every span samples, in three rings."""
+
+    def __init__(self, capacity, span, samples=0):
+        self.span = span
+        self.version = samples // span # points completed so far
+        self.rings = { 'min': RingBuffer(capacity), 'max': RingBuffer(capacity), 'mean': RingBuffer(capacity) }
+        self._reset()
+
+        # Samples the first point is short of, keeps tiers of histories
+        # created at different times completing points together
+        self._phase = samples % span
+
+    def _reset(self):
+        self._phase = 0
+        self._count = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+
+    def add(self, value):
+        """Accumulate a sample, return True when it completed a point."""
+        self._count += 1
+        self._sum += value
+        self._min = value if self._min is None else min(self._min, value)
+        self._max = value if self._max is None else max(self._max, value)
+
+        if self._phase + self._count < self.span:
+            return False
+
+        self.rings['min'].append(self._min)
+        self.rings['max'].append(self._max)
+        self.rings['mean'].append(self._sum / self._count)
+        self.version += 1
+        self._reset()
+        return True
+
+
+class TempHistory(object):
+    """
+    @var samples: number of samples appended, counting those it was created with
+    """
+
+    def __init__(self, capacity, spans=(1, 6, 36, 216), samples=0):
+        """
+        capacity - points kept per tier, normally the graph width in pixels
+        spans - samples per point of each tier, the first one should be 1
+        samples - samples other histories it is drawn along with already have
+        """
+        self.capacity = capacity
+        self.samples = samples
+        self.tiers = [Tier(capacity, span, samples) for span in spans]
+
+    def append(self, value):
+        self.samples += 1
+        for tier in self.tiers:
+            tier.add(value)
+
+    def series(self, tier, kind='mean'):
+        """Return all points of a tier, oldest first."""
+        return self.tiers[tier].rings[kind].values()
+
+    def tail(self, tier, count, kind='mean'):
+        """Return the newest count points of a tier, oldest first."""
+        return self.tiers[tier].rings[kind].tail(count)
+
+    def version(self, tier):
+        """Return the number of points a tier has completed, for change detection."""
+        return self.tiers[tier].version
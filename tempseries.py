@@ -0,0 +1,103 @@
+"""
+SeriesRegistry for OctoPiPanel
+
+Keeps one TempSeries per temperature sensor reported by OctoPrint (tool0,
+tool1, bed, chamber, ...). Sensors are discovered from the status as they
+appear, each gets its own TempHistory and a color, so the graph can draw any
+number of them with the same code.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import temphistory
+
+# Trace and target line colors of well known sensors
+COLORS = {
+    'tool0':   ((220,   0,   0), (180,  40,  40)),
+    'bed':     ((  0,   0, 220), ( 40,  40, 180)),
+    'tool1':   ((  0, 150,   0), ( 40, 120,  40)),
+    'chamber': ((200, 120,   0), (160, 110,  40)),
+}
+
+# Colors for any other sensor, used in turn
+PALETTE = (
+    ((160,   0, 160), (130,  40, 130)),
+    ((  0, 150, 150), ( 40, 120, 120)),
+    ((120,  80,  40), (100,  80,  60)),
+    ((100, 100, 100), ( 80,  80,  80)),
+)
+
+
+class TempSeries(object):
+
+    def __init__(self, key, capacity, spans, colors, samples=0):
+        self.key = key
+        self.color, self.target_color = colors
+        self.history = temphistory.TempHistory(capacity, spans, samples)
+        self.actual = 0.0
+        self.target = 0.0
+
+
+class SeriesRegistry(object):
+    """
+    @var samples: number of samples appended to every series
+    @var structure: bumped whenever a series is added
+    """
+
+    def __init__(self, capacity, spans=(1, 6, 36, 216)):
+        self.capacity = capacity
+        self.spans = spans
+        self.samples = 0
+        self.structure = 0
+        self.series = []
+        self._byKey = {}
+
+    def update(self, temps):
+        """Set actual and target of every sensor from (key, actual, target) tuples."""
+        for key, actual, target in temps:
+            series = self._byKey.get(key)
+            if series is None:
+                series = self._add(key)
+            series.actual = actual
+            series.target = target
+
+    def _add(self, key):
+        if key in COLORS:
+            colors = COLORS[key]
+        else:
+            colors = PALETTE[sum(1 for s in self.series if s.key not in COLORS) % len(PALETTE)]
+
+        series = TempSeries(key, self.capacity, self.spans, colors, self.samples)
+        self.series.append(series)
+        self._byKey[key] = series
+        self.structure += 1
+        return series
+
+    def append(self):
+        """Save the current temperature of every series to its history."""
+        self.samples += 1
+        for series in self.series:
+            series.history.append(series.actual)
+
+    def get(self, key):
+        return self._byKey.get(key)
+
+    def version(self, tier):
+        """Return the points completed in a tier, the same for every series."""
+        if not self.series:
+            return 0
+        return self.series[0].history.version(tier)
+
+    def tier_for(self, samples):
+        """Return the finest tier which covers the latest samples."""
+        for i, span in enumerate(self.spans):
+            if span * self.capacity >= samples:
+                return i
+        return len(self.spans) - 1
+
+    def __iter__(self):
+        return iter(self.series)
+
+    def __len__(self):
+        return len(self.series)
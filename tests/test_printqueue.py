@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of PrintQueue for OctoPiPanel, run with
+
+    python -m unittest discover tests
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fileindex
+import octoclient
+import printqueue
+import commandqueue
+
+# Nothing listens there, every command fails with a connection error
+UNREACHABLE = 'http://127.0.0.1:1'
+
+
+class SelectTest(unittest.TestCase):
+
+    def setUp(self):
+        # Not a UTF-8 terminal, like stdout of the panel run by the init script
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+        client = octoclient.OctoPrintClient(UNREACHABLE, 'key', timeout=1.0, retries=0)
+        self.commands = commandqueue.CommandQueue(client, timeout=2.0)
+        self.commands.start()
+
+    def tearDown(self):
+        self.commands.stop()
+        self.commands.join(2.0)
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+    def finished(self):
+        """Wait for the next finished commands."""
+        deadline = time.time() + 5.0
+        while time.time() < deadline:
+            done = self.commands.results()
+            if done:
+                return done
+            time.sleep(0.05)
+        return []
+
+    def test_failed_select_of_non_ascii_name(self):
+        name = u"Würfel.gcode"
+        queue = printqueue.PrintQueue(self.commands)
+        command = queue.select(fileindex.FileEntry('local', name, name, 1000, None, None), True)
+        self.assertEqual(self.finished(), [command])
+        self.assertEqual(command.error, "Connection Error")
+
+        # The queue still sends, and reports, the commands after it
+        later = self.commands.submit('/api/printer/command', { 'command': 'M84' }, u"Motors off")
+        self.assertEqual(self.finished(), [later])
+        self.assertEqual(later.error, "Connection Error")
+
+
+if __name__ == '__main__':
+    unittest.main()
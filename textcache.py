@@ -0,0 +1,59 @@
+"""
+TextCache for OctoPiPanel
+
+Caches rendered text surfaces so that a font only rasterises a string when
+the displayed value actually changes. Surfaces are kept in least recently
+used order and the oldest is evicted once the cache is full.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+from collections import OrderedDict
+
+
+class TextCache(object):
+    """
+    @var hits: number of renders served from the cache
+    @var misses: number of renders that had to rasterise the text
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._surfaces = OrderedDict()
+
+    def render(self, font, text, antialias, color, background=None):
+        """Same as font.render(), but returns a cached surface when possible.
+
+        The returned surface is shared, it must not be drawn on."""
+        key = (font, font.get_bold(), font.get_italic(), font.get_underline(), text, bool(antialias),
+               tuple(color), None if background is None else tuple(background))
+
+        surface = self._surfaces.pop(key, None)
+        if surface is None:
+            self.misses += 1
+            if background is None:
+                surface = font.render(text, antialias, color)
+            else:
+                surface = font.render(text, antialias, color, background)
+
+            if len(self._surfaces) >= self.size:
+                self._surfaces.popitem(last=False)
+        else:
+            self.hits += 1
+
+        # Most recently used last
+        self._surfaces[key] = surface
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+
+# Shared by the panel labels and the button captions
+cache = TextCache()
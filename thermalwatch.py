@@ -0,0 +1,191 @@
+"""
+ThermalWatch for OctoPiPanel
+
+Watches every temperature sample for a heater that fails or runs away, much
+like the thermal protection of the printer firmware, as a second line of
+defence the user can see. Every sensor keeps an exponentially weighted mean
+and rate of its temperature and the variance of its sample to sample noise,
+so each sample costs the same no matter how long the panel runs. Flagged:
+
+    stall       heating, but the temperature does not rise, or at its rate
+                the target is not reached in time
+    overshoot   well above the target and not coming down
+    runaway     far above the target and still rising, rising well with a
+                heater turned off a short while ago, or falling well below
+                a target already reached
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import math
+from collections import namedtuple, deque
+
+STALL = 'stall'
+OVERSHOOT = 'overshoot'
+RUNAWAY = 'runaway'
+
+# period - seconds the temperature must rise by hysteresis in while
+#     heating, and a condition must last before it is flagged
+# hysteresis - degrees of change that count, widened by the sensor noise
+# window - degrees below the target that count as having reached it
+# heat_timeout - seconds the heater may take to reach its target
+# overshoot - degrees above the target flagged as overshoot, twice that as runaway
+# drop - degrees below a target already reached flagged as runaway
+Limits = namedtuple('Limits', ('period', 'hysteresis', 'window', 'heat_timeout', 'overshoot', 'drop'))
+
+LIMITS = {
+    'tool': Limits(period=40, hysteresis=2.0, window=5.0, heat_timeout=900, overshoot=15.0, drop=15.0),
+    'bed': Limits(period=120, hysteresis=2.0, window=5.0, heat_timeout=1800, overshoot=10.0, drop=10.0),
+    'chamber': Limits(period=600, hysteresis=1.0, window=3.0, heat_timeout=3600, overshoot=10.0, drop=10.0),
+}
+
+Anomaly = namedtuple('Anomaly', ('key', 'kind', 'actual', 'target'))
+
+
+def limits_for(key):
+    """Return the Limits of the sensor key, tools unless it is a bed or chamber."""
+    for kind in ('bed', 'chamber'):
+        if key.startswith(kind):
+            return LIMITS[kind]
+    return LIMITS['tool']
+
+
+class SensorWatch(object):
+    """
+    @var mean: smoothed temperature
+    @var rate: smoothed change of the temperature in degrees per second
+    @var noise: smoothed variance of the sample to sample change, rate taken out
+    @var reached: whether the temperature reached the current target
+    @var heated: time.time() of the last sample with a target, None if never
+    @var anomaly: kind of the anomaly flagged now, None if all is well
+    """
+
+    def __init__(self, key, limits=None):
+        self.key = key
+        self.limits = limits or limits_for(key)
+        self.target = None
+        self.last_time = None
+        self.last_actual = 0.0
+        self.mean = 0.0
+        self.rate = 0.0
+        self.noise = 0.0
+        self.heated = None
+        self.anomaly = None
+
+    def _restart(self, now, target):
+        """Start watching the heater towards target from the current temperature."""
+        self.target = target
+        self.target_time = now
+        self.ref_temp = self.mean
+        self.ref_time = now
+        self.reached = False
+        self.since = None
+
+    def update(self, now, actual, target):
+        """Take a sample at time.time() now. Returns the kind of anomaly flagged, None if none."""
+        limits = self.limits
+        if self.last_time is None or now - self.last_time > limits.period:
+            # First sample, or the first after a gap, nothing to compare with
+            self.last_time = now
+            self.last_actual = self.mean = actual
+            self.rate = self.noise = 0.0
+            self._restart(now, target)
+            self.anomaly = None
+            return None
+
+        dt = now - self.last_time
+        if dt <= 0:
+            return self.anomaly
+        alpha = 1 - math.exp(-dt / (limits.period / 4.0))
+        residual = (actual - self.last_actual) - self.rate * dt
+        self.noise = (1 - alpha) * (self.noise + alpha * residual * residual)
+        self.rate += alpha * ((actual - self.last_actual) / dt - self.rate)
+        self.mean += alpha * (actual - self.mean)
+        self.last_time = now
+        self.last_actual = actual
+
+        if target != self.target:
+            self._restart(now, target)
+        if target > 0:
+            self.heated = now
+
+        # Rising or falling means by more than the hysteresis in a period
+        margin = limits.hysteresis + 3 * math.sqrt(self.noise)
+        slope = margin / limits.period
+        kind = None
+        if target > 0:
+            # Close to the target the approach slows down, like the watch
+            # period of the firmware stall checks end there
+            if not self.reached and self.mean >= target - margin - limits.window:
+                self.reached = True
+            if actual >= self.ref_temp + margin:
+                self.ref_temp, self.ref_time = actual, now
+
+            if self.mean > target + 2 * limits.overshoot and self.rate > slope:
+                kind = RUNAWAY
+            elif self.mean > target + limits.overshoot and self.rate > -slope:
+                kind = OVERSHOOT
+            elif self.reached and self.mean < target - limits.drop:
+                kind = RUNAWAY
+            elif not self.reached:
+                heating = now - self.target_time
+                if now - self.ref_time > limits.period or heating > limits.heat_timeout:
+                    kind = STALL
+                elif heating > limits.period and self.rate > 0 and heating + (target - self.mean) / self.rate > limits.heat_timeout:
+                    # At this rate the target is not reached in time
+                    kind = STALL
+        elif self.heated is not None and now - self.heated < limits.heat_timeout:
+            # Heater turned off a short while ago, the temperature should only
+            # go down. Sensors never heated, or heated long ago, warm up with
+            # the room or the heaters next to them.
+            if actual < self.ref_temp:
+                self.ref_temp, self.ref_time = actual, now
+            elif self.mean > self.ref_temp + 2 * limits.overshoot:
+                kind = RUNAWAY
+
+        # Conditions must last a while, a fan kicking in is no runaway
+        if kind is None:
+            self.since = None
+        elif self.since is None or self.since[0] != kind:
+            self.since = (kind, now)
+        if kind is not None and now - self.since[1] < limits.period:
+            kind = self.anomaly
+
+        self.anomaly = kind
+        return kind
+
+
+class ThermalWatch(object):
+    """
+    @var sensors: SensorWatch per sensor key
+    """
+
+    def __init__(self, limits=None):
+        """limits is a dict of Limits per sensor key, overriding limits_for()."""
+        self.limits = limits or {}
+        self.sensors = {}
+        self._raised = deque()
+
+    def update(self, now, temps):
+        """Check the current temperature of every series of temps, a SeriesRegistry."""
+        for series in temps:
+            sensor = self.sensors.get(series.key)
+            if sensor is None:
+                sensor = self.sensors[series.key] = SensorWatch(series.key, self.limits.get(series.key))
+
+            before = sensor.anomaly
+            kind = sensor.update(now, series.actual, series.target)
+            if kind is not None and kind != before:
+                self._raised.append(Anomaly(series.key, kind, series.actual, series.target))
+
+    def results(self):
+        """Return the anomalies flagged since the last call, oldest first."""
+        raised = []
+        while self._raised:
+            raised.append(self._raised.popleft())
+        return raised
+
+    def active(self):
+        """Return (key, kind) of every sensor flagged now, sorted by key."""
+        return tuple(sorted((key, sensor.anomaly) for key, sensor in self.sensors.iteritems() if sensor.anomaly is not None))
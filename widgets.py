@@ -0,0 +1,104 @@
+"""
+WidgetRegistry for OctoPiPanel
+
+Keeps the buttons of a screen together with what they do, when they are
+shown and what they say. Buttons are indexed by the grid cells their rects
+cover, so a mouse event is only handed to the button under the pointer (and
+to buttons still tracking an earlier press or hover), and mouse motion is
+dropped altogether while no button cares about it.
+"""
+
+__author__ = "Jonas Lorander"
+__license__ = "Simplified BSD 2-Clause License"
+
+import pygame
+from pygame.locals import MOUSEMOTION, MOUSEBUTTONDOWN, MOUSEBUTTONUP
+
+
+class Widget(object):
+
+    def __init__(self, button, onclick, visible=None, caption=None):
+        """
+        button - the PygButton
+        onclick - called without arguments when the button is clicked
+        visible, caption - called by WidgetRegistry.update() for the current
+            visibility and caption of the button, None leaves them alone
+        """
+        self.button = button
+        self.onclick = onclick
+        self.visible = visible
+        self.caption = caption
+
+    def engaged(self):
+        """True while the button tracks a hover or press and must see the events that end it."""
+        button = self.button
+        return button.mouseOverButton or button.buttonDown or button.lastMouseDownOverButton
+
+
+class WidgetRegistry(object):
+    """
+    @var widgets: every Widget, in the order they were added
+    @var groups: (rect, buttons) of buttons sharing a rect, e.g. start and
+        abort, which are repainted together
+    """
+
+    def __init__(self, cell=32):
+        self.cell = cell
+        self.widgets = []
+        self.groups = []
+        self._grid = {}
+        self._engaged = []
+
+    def add(self, button, onclick, visible=None, caption=None):
+        """Register button, see Widget for the arguments. Returns the button."""
+        widget = Widget(button, onclick, visible, caption)
+        self.widgets.append(widget)
+
+        for rect, buttons in self.groups:
+            if rect == button.rect:
+                buttons.append(button)
+                break
+        else:
+            self.groups.append((pygame.Rect(button.rect), [button]))
+
+        rect = button.rect
+        for x in range(rect.left // self.cell, (rect.right - 1) // self.cell + 1):
+            for y in range(rect.top // self.cell, (rect.bottom - 1) // self.cell + 1):
+                self._grid.setdefault((x, y), []).append(widget)
+
+        return button
+
+    def hit(self, pos):
+        """Return the visible Widget at pos, or None."""
+        for widget in self._grid.get((pos[0] // self.cell, pos[1] // self.cell), ()):
+            if widget.button.visible and widget.button.rect.collidepoint(pos):
+                return widget
+        return None
+
+    def update(self):
+        """Set visibility and caption of every button from its callables."""
+        for widget in self.widgets:
+            if widget.visible is not None:
+                widget.button.visible = widget.visible()
+            if widget.caption is not None:
+                widget.button.caption = widget.caption()
+
+    def handle_event(self, event):
+        """Route a mouse event to the buttons concerned and call onclick of a clicked one."""
+        if event.type not in (MOUSEMOTION, MOUSEBUTTONDOWN, MOUSEBUTTONUP):
+            return
+
+        target = self.hit(event.pos)
+        if event.type == MOUSEMOTION and target is None and not self._engaged:
+            # Nothing hovered before or now
+            return
+
+        routed = list(self._engaged)
+        if target is not None and target not in routed:
+            routed.append(target)
+
+        for widget in routed:
+            if 'click' in widget.button.handleEvent(event):
+                widget.onclick()
+
+        self._engaged = [widget for widget in routed if widget.engaged()]